@@ -1,19 +1,43 @@
 """Helper functions for interacting with the DTC Query API for mass balance and sea-level response computations."""
 
+import contextlib
 import io
 import json
 import os
+import threading
 import time
+from collections import OrderedDict
+from collections.abc import Iterable
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
 from datetime import datetime
 
 import requests
 import tenacity
 import xarray as xr
 
+from dtc_is_notebook_helpers.dataset_io_helpers import download_dataset
+
 DTC_QUERY_API_URL = "https://query.dtc-ice-sheets.org"
 
 WORKFLOW_API_TIMEOUT = 600  # seconds
 GENERAL_API_TIMEOUT = 10  # seconds
+JOB_POLL_INTERVAL = 2  # seconds
+
+SELREM_ANALYSIS_MODES = ["global", "annual"]
+# Maximum number of SELREM jobs waited on concurrently by prefetch_selrem_module
+SELREM_MAX_CONCURRENT_JOBS = 4
+
+# Maximum number of (vmb_url, scale) pairs whose annual SELREM results are cached, least recently used evicted first
+SELREM_CACHE_MAX_ENTRIES = 8
+
+# Annual SELREM results per (vmb_url, scale), keyed by year, in least to most recently used order
+_ANNUAL_SLR_CACHE: OrderedDict[tuple[str, float], dict[int, xr.Dataset]] = OrderedDict()
+# Years per (vmb_url, scale) whose SELREM job is running, so concurrent runs wait for them instead of resubmitting
+_ANNUAL_SLR_IN_FLIGHT: dict[tuple[str, float], set[int]] = {}
+# Guards both of the above, which are used from prefetch and scheduler threads, and is notified when years finish
+_ANNUAL_SLR_CACHE_CONDITION = threading.Condition()
+
+_SELREM_EXECUTOR = ThreadPoolExecutor(max_workers=SELREM_MAX_CONCURRENT_JOBS, thread_name_prefix="selrem")
 
 
 def get_auth_headers() -> dict:
@@ -89,16 +113,394 @@ def get_precomputed_mass_balance_dataset_url(dataset: str) -> str:
     ).json()["url"]
 
 
+def _seconds_left(deadline: float | None, description: str) -> float | None:
+    """
+    Return the number of seconds left before a deadline.
+
+    Parameters
+    ----------
+    deadline : float | None
+        Value of time.monotonic() after which to give up, or None for no deadline.
+    description : str
+        Description of what did not finish in time, used in the error message.
+
+    Returns
+    -------
+    float | None
+        The seconds left before the deadline, or None if there is no deadline.
+
+    Raises
+    ------
+    TimeoutError
+        If the deadline has passed.
+    """
+    if deadline is None:
+        return None
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError(f"{description} did not finish before the deadline")
+    return remaining
+
+
+def _request_timeout(remaining: float | None, deadline_limit: float) -> float:
+    """
+    Return the timeout of an HTTP request to the DTC Query API, so it cannot outlive the deadline of its caller.
+
+    Parameters
+    ----------
+    remaining : float | None
+        The seconds left before the deadline, or None for no deadline.
+    deadline_limit : float
+        Maximum timeout in seconds when there is a deadline.
+
+    Returns
+    -------
+    float
+        The request timeout in seconds: WORKFLOW_API_TIMEOUT without a deadline, otherwise the seconds left before the
+        deadline, capped at deadline_limit.
+    """
+    return WORKFLOW_API_TIMEOUT if remaining is None else min(remaining, deadline_limit)
+
+
+def _submit_selrem_job(
+    vmb_url: str,
+    scale: float,
+    start_year: int,
+    end_year: int,
+    analysis_mode: str,
+    deadline: float | None = None,
+    cancel_event: threading.Event | None = None,
+) -> str:
+    """
+    Submit a SELREM job to the DTC Query API and return its job ID.
+
+    Parameters
+    ----------
+    vmb_url : str
+        The S3 URL of the volume mass balance dataset.
+    scale : float
+        The scaling factor to apply to the mass balance data.
+    start_year : int
+        The start year for the analysis period.
+    end_year : int
+        The end year for the analysis period.
+    analysis_mode : str
+        The analysis mode to use, should be either "global" or "annual".
+    deadline : float | None, optional
+        Value of time.monotonic() after which no job should be submitted anymore, by default None (no deadline).
+    cancel_event : threading.Event | None, optional
+        Event that, once set, prevents the job from being submitted, by default None.
+
+    Returns
+    -------
+    str
+        The ID of the submitted job.
+
+    Raises
+    ------
+    TimeoutError
+        If the deadline has passed before the job is submitted.
+    CancelledError
+        If cancel_event is set before the job is submitted.
+    """
+    description = f"Submission of SELREM job for {start_year}-{end_year}"
+    if cancel_event is not None and cancel_event.is_set():
+        raise CancelledError(f"{description} was cancelled by the caller")
+    remaining = _seconds_left(deadline, description)
+    start_time = datetime(start_year, 1, 1)
+    end_time = datetime(end_year, 12, 31)
+    try:
+        resp = requests.post(
+            f"{DTC_QUERY_API_URL}/sea-level-response",
+            headers=get_auth_headers(),
+            data=json.dumps(
+                {
+                    "mass_balance_url": vmb_url,
+                    "scaling_factor": scale,
+                    "start_time": start_time.isoformat(),
+                    "end_time": end_time.isoformat(),
+                    "analysis_mode": analysis_mode,
+                }
+            ),
+            # Submission can be slow, and a timed out submission may still create a job that would be orphaned
+            timeout=_request_timeout(remaining, WORKFLOW_API_TIMEOUT),
+        )
+    except requests.exceptions.Timeout as e:
+        _seconds_left(deadline, description)
+        raise e
+    resp.raise_for_status()
+    return resp.json()["job_id"]
+
+
+def cancel_selrem_job(job_id: str) -> None:
+    """
+    Cancel a running SELREM job so it stops consuming server compute.
+
+    Parameters
+    ----------
+    job_id : str
+        The ID of the job to cancel.
+    """
+    resp = requests.post(
+        f"{DTC_QUERY_API_URL}/jobs/{job_id}/cancel", headers=get_auth_headers(), timeout=GENERAL_API_TIMEOUT
+    )
+    resp.raise_for_status()
+
+
+def _wait_for_selrem_job(
+    job_id: str, deadline: float | None = None, cancel_event: threading.Event | None = None
+) -> str:
+    """
+    Poll a SELREM job until it finishes and return the URL of its output dataset.
+
+    If the wait fails for any reason before the job finishes, e.g. the deadline passes, cancel_event is set, the wait is
+    interrupted with KeyboardInterrupt or polling raises a connection error, the job is cancelled on the server before
+    the exception propagates. With a deadline, polling requests and sleeps are cut short so they end by the deadline.
+
+    Parameters
+    ----------
+    job_id : str
+        The ID of the job to poll.
+    deadline : float | None, optional
+        Value of time.monotonic() after which to give up on the job, by default None (wait indefinitely).
+    cancel_event : threading.Event | None, optional
+        Event that, once set, makes the wait give up on the job, by default None.
+
+    Returns
+    -------
+    str
+        The URL of the sea-level response dataset produced by the job.
+
+    Raises
+    ------
+    RuntimeError
+        If the SELREM job fails or is cancelled.
+    TimeoutError
+        If the SELREM job does not finish before the deadline.
+    CancelledError
+        If cancel_event is set before the SELREM job finishes.
+    """
+    description = f"SELREM job {job_id}"
+    try:
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                raise CancelledError(f"SELREM job {job_id} was cancelled by the caller")
+            remaining = _seconds_left(deadline, description)
+            time.sleep(JOB_POLL_INTERVAL if remaining is None else min(remaining, JOB_POLL_INTERVAL))
+            remaining = _seconds_left(deadline, description)
+            try:
+                resp = requests.get(
+                    f"{DTC_QUERY_API_URL}/jobs/{job_id}",
+                    headers=get_auth_headers(),
+                    # Status requests are cheap, so they are bounded tightly to end close to the deadline
+                    timeout=_request_timeout(remaining, GENERAL_API_TIMEOUT),
+                )
+            except requests.exceptions.Timeout as e:
+                _seconds_left(deadline, description)
+                raise e
+            resp.raise_for_status()
+            res = resp.json()
+            if res["status"] in ["Succeeded", "Failed", "Error", "Cancelled", "Terminated"]:
+                break
+    except BaseException:
+        # Cancelling is best effort, the original exception is what the caller needs to see
+        with contextlib.suppress(requests.exceptions.RequestException):
+            cancel_selrem_job(job_id)
+        raise
+    if res["status"] != "Succeeded":
+        raise RuntimeError(f"SELREM job {job_id} failed or was cancelled")
+    return res["outputs"]["main"]["output_path"]
+
+
+def _open_selrem_output(slr_url: str, download: bool) -> xr.Dataset:
+    """
+    Open the output dataset of a SELREM job, either lazily or fully downloaded.
+
+    Parameters
+    ----------
+    slr_url : str
+        The URL of the sea-level response dataset.
+    download : bool
+        Whether to download all chunks concurrently with download_dataset instead of opening the dataset lazily.
+
+    Returns
+    -------
+    xr.Dataset
+        The sea-level response dataset.
+    """
+    if download:
+        return download_dataset(slr_url)
+    return xr.open_dataset(slr_url, engine="zarr")
+
+
+def _missing_year_ranges(cached_years: Iterable[int], start_year: int, end_year: int) -> list[tuple[int, int]]:
+    """
+    Return the contiguous (start_year, end_year) ranges within the requested period that are not cached.
+
+    Parameters
+    ----------
+    cached_years : Iterable[int]
+        The years for which results are already cached.
+    start_year : int
+        The start year of the requested period.
+    end_year : int
+        The end year of the requested period.
+
+    Returns
+    -------
+    list[tuple[int, int]]
+        Inclusive year ranges that still need to be computed, in ascending order.
+    """
+    cached = set(cached_years)
+    ranges = []
+    range_start = None
+    for year in range(start_year, end_year + 2):
+        if year <= end_year and year not in cached:
+            if range_start is None:
+                range_start = year
+        elif range_start is not None:
+            ranges.append((range_start, year - 1))
+            range_start = None
+    return ranges
+
+
+def _release_in_flight_years(key: tuple[str, float], years: set[int]) -> None:
+    """
+    Mark years as no longer being computed and wake up the runs waiting for them. Must be called with the lock held.
+
+    Parameters
+    ----------
+    key : tuple[str, float]
+        The (vmb_url, scale) pair the years belong to.
+    years : set[int]
+        The years whose SELREM job finished or failed.
+    """
+    in_flight = _ANNUAL_SLR_IN_FLIGHT.get(key)
+    if in_flight is not None:
+        in_flight.difference_update(years)
+        if not in_flight:
+            del _ANNUAL_SLR_IN_FLIGHT[key]
+    _ANNUAL_SLR_CACHE_CONDITION.notify_all()
+
+
+def _run_annual_selrem_with_cache(
+    vmb_url: str,
+    scale: float,
+    start_year: int,
+    end_year: int,
+    download: bool,
+    deadline: float | None,
+    cancel_event: threading.Event | None,
+) -> xr.Dataset:
+    """
+    Run the annual SELREM module, only submitting jobs for years not already cached for (vmb_url, scale).
+
+    The cache is shared between threads, e.g. prefetch_selrem_module and SelremRequestScheduler runs. Years whose job
+    was already submitted by a concurrent run are waited for instead of being submitted again.
+
+    Parameters
+    ----------
+    vmb_url : str
+        The S3 URL of the volume mass balance dataset.
+    scale : float
+        The scaling factor to apply to the mass balance data.
+    start_year : int
+        The start year for the analysis period.
+    end_year : int
+        The end year for the analysis period.
+    download : bool
+        Whether to download newly computed outputs concurrently instead of opening them lazily.
+    deadline : float | None
+        Value of time.monotonic() after which to give up on the remaining jobs, or None to wait indefinitely.
+    cancel_event : threading.Event | None
+        Event that, once set, cancels the remaining jobs, or None.
+
+    Returns
+    -------
+    xr.Dataset
+        The xarray dataset containing the annual sea-level response data for the requested years.
+    """
+    key = (vmb_url, scale)
+    years = range(start_year, end_year + 1)
+    year_datasets: dict[int, xr.Dataset] = {}
+    while True:
+        with _ANNUAL_SLR_CACHE_CONDITION:
+            year_cache = _ANNUAL_SLR_CACHE.setdefault(key, {})
+            _ANNUAL_SLR_CACHE.move_to_end(key)
+            while len(_ANNUAL_SLR_CACHE) > SELREM_CACHE_MAX_ENTRIES:
+                _ANNUAL_SLR_CACHE.popitem(last=False)
+            year_datasets.update({year: year_cache[year] for year in years if year in year_cache})
+            missing_years = {year for year in years if year not in year_datasets}
+            if not missing_years:
+                break
+            in_flight = _ANNUAL_SLR_IN_FLIGHT.setdefault(key, set())
+            claimed_years = missing_years - in_flight
+            if not claimed_years:
+                # Another run is computing all missing years, wait for it to store them or give up
+                if cancel_event is not None and cancel_event.is_set():
+                    raise CancelledError(f"SELREM run for {start_year}-{end_year} was cancelled by the caller")
+                remaining = _seconds_left(deadline, f"SELREM run for {start_year}-{end_year}")
+                _ANNUAL_SLR_CACHE_CONDITION.wait(
+                    JOB_POLL_INTERVAL if remaining is None else min(remaining, JOB_POLL_INTERVAL)
+                )
+                continue
+            in_flight.update(claimed_years)
+        missing_ranges = _missing_year_ranges(set(years) - claimed_years, start_year, end_year)
+        pending_years = set(claimed_years)
+        try:
+            for range_start, range_end in missing_ranges:
+                job_id = _submit_selrem_job(vmb_url, scale, range_start, range_end, "annual", deadline, cancel_event)
+                ds = _open_selrem_output(_wait_for_selrem_job(job_id, deadline, cancel_event), download)
+                range_datasets = {
+                    year: ds.sel(time=slice(datetime(year, 1, 1), datetime(year, 12, 31)))
+                    for year in range(range_start, range_end + 1)
+                }
+                year_datasets.update(range_datasets)
+                with _ANNUAL_SLR_CACHE_CONDITION:
+                    _ANNUAL_SLR_CACHE.setdefault(key, {}).update(range_datasets)
+                    while len(_ANNUAL_SLR_CACHE) > SELREM_CACHE_MAX_ENTRIES:
+                        _ANNUAL_SLR_CACHE.popitem(last=False)
+                    _release_in_flight_years(key, set(range_datasets))
+                pending_years.difference_update(range_datasets)
+                if missing_ranges == [(start_year, end_year)]:
+                    # Nothing was cached, so the fresh output already covers the full period
+                    return ds
+        finally:
+            with _ANNUAL_SLR_CACHE_CONDITION:
+                # Release the years that were not computed, e.g. after a failure, so other runs can claim them
+                _release_in_flight_years(key, pending_years)
+    return xr.concat([year_datasets[year] for year in years], dim="time")
+
+
+def clear_selrem_cache() -> None:
+    """
+    Clear all cached annual SELREM results.
+
+    The cache only keeps the SELREM_CACHE_MAX_ENTRIES most recently used (vmb_url, scale) pairs, so it stays bounded
+    without calling this. Clearing it frees the memory of all cached results at once, e.g. after large downloads.
+    """
+    with _ANNUAL_SLR_CACHE_CONDITION:
+        _ANNUAL_SLR_CACHE.clear()
+
+
 def run_selrem_module(
     vmb_url: str,
     scale: float,
     start_year: int,
     end_year: int,
     analysis_mode: str = "global",
+    use_cache: bool = True,
+    download: bool = False,
+    timeout: float | None = None,
+    cancel_event: threading.Event | None = None,
 ) -> xr.Dataset:
     """
     Run the SELREM module to compute and plot sea-level response from mass balance data.
 
+    In "annual" mode, results are cached per year for each (vmb_url, scale) pair, so extending or shifting the analysis
+    period only submits SELREM jobs for the years that have not been computed yet. Only the SELREM_CACHE_MAX_ENTRIES
+    most recently used pairs are kept, see clear_selrem_cache.
+
     Parameters
     ----------
     vmb_url : str
@@ -111,6 +513,17 @@ def run_selrem_module(
         The end year for the analysis period.
     analysis_mode : str, optional
         The analysis mode to use, should be either "global" or "annual", by default "global"
+    use_cache : bool, optional
+        Whether to reuse cached annual results, by default True. Has no effect in "global" mode.
+    download : bool, optional
+        Whether to download the output with concurrent chunk requests (see download_dataset) instead of opening it
+        lazily, by default False.
+    timeout : float | None, optional
+        Maximum number of seconds to wait for the SELREM job(s) of this call, by default None (wait indefinitely). When
+        it is exceeded, or the call is interrupted or fails, the running job is cancelled on the server and no further
+        job is submitted.
+    cancel_event : threading.Event | None, optional
+        Event that, once set (e.g. from another thread), cancels the running job on the server, by default None.
 
     Returns
     -------
@@ -121,36 +534,83 @@ def run_selrem_module(
     ------
     RuntimeError
         If the SELREM job fails or is cancelled.
+    TimeoutError
+        If the SELREM job(s) do not finish within timeout seconds.
+    CancelledError
+        If cancel_event is set before the SELREM job(s) finish.
     """
-    start_time = datetime(start_year, 1, 1)
-    end_time = datetime(end_year, 12, 31)
-    """Run the SELREM module to compute and plot sea-level response from mass balance data."""
-    resp = requests.post(
-        f"{DTC_QUERY_API_URL}/sea-level-response",
-        headers=get_auth_headers(),
-        data=json.dumps(
-            {
-                "mass_balance_url": vmb_url,
-                "scaling_factor": scale,
-                "start_time": start_time.isoformat(),
-                "end_time": end_time.isoformat(),
-                "analysis_mode": analysis_mode,
-            }
-        ),
-        timeout=WORKFLOW_API_TIMEOUT,
-    )
-    resp.raise_for_status()
-    job_id = resp.json()["job_id"]
-    while True:
-        time.sleep(2)
-        resp = requests.get(
-            f"{DTC_QUERY_API_URL}/jobs/{job_id}", headers=get_auth_headers(), timeout=WORKFLOW_API_TIMEOUT
+    deadline = None if timeout is None else time.monotonic() + timeout
+    if analysis_mode == "annual" and use_cache:
+        return _run_annual_selrem_with_cache(vmb_url, scale, start_year, end_year, download, deadline, cancel_event)
+    job_id = _submit_selrem_job(vmb_url, scale, start_year, end_year, analysis_mode, deadline, cancel_event)
+    slr_url = _wait_for_selrem_job(job_id, deadline, cancel_event)
+    return _open_selrem_output(slr_url, download)
+
+
+def prefetch_selrem_module(
+    vmb_url: str,
+    scale: float,
+    start_year: int,
+    end_year: int,
+    analysis_modes: tuple[str, ...] = ("global", "annual"),
+    download: bool = False,
+    timeout: float | None = None,
+    cancel_event: threading.Event | None = None,
+) -> dict[str, Future]:
+    """
+    Submit SELREM runs for several analysis modes concurrently, without waiting for them to finish.
+
+    Each run is executed by run_selrem_module in a background thread, so the "global" and "annual" jobs for the same
+    mass balance selection are computed at the same time instead of back to back. Use Future.result() to wait for a
+    specific mode, or concurrent.futures.as_completed to consume whichever finishes first.
+
+    Future.cancel() cannot stop a run that has already started, and interrupting the notebook does not reach the
+    background threads. To stop the runs and cancel their jobs on the server, e.g. when the prefetched results are no
+    longer needed, set cancel_event.
+
+    Parameters
+    ----------
+    vmb_url : str
+        The S3 URL of the volume mass balance dataset.
+    scale : float
+        The scaling factor to apply to the mass balance data.
+    start_year : int
+        The start year for the analysis period.
+    end_year : int
+        The end year for the analysis period.
+    analysis_modes : tuple[str, ...], optional
+        The analysis modes to run, by default ("global", "annual").
+    download : bool, optional
+        Whether to download the outputs with concurrent chunk requests, by default False.
+    timeout : float | None, optional
+        Maximum number of seconds to wait for each run, by default None (wait indefinitely).
+    cancel_event : threading.Event | None, optional
+        Event that, once set, cancels all runs and their SELREM jobs, by default None.
+
+    Returns
+    -------
+    dict[str, Future]
+        Futures resolving to the sea-level response dataset of each analysis mode, keyed by analysis mode.
+
+    Raises
+    ------
+    ValueError
+        If an unknown analysis mode is specified.
+    """
+    for analysis_mode in analysis_modes:
+        if analysis_mode not in SELREM_ANALYSIS_MODES:
+            raise ValueError(f"Unknown analysis mode: {analysis_mode}")
+    return {
+        analysis_mode: _SELREM_EXECUTOR.submit(
+            run_selrem_module,
+            vmb_url,
+            scale,
+            start_year,
+            end_year,
+            analysis_mode,
+            download=download,
+            timeout=timeout,
+            cancel_event=cancel_event,
         )
-        resp.raise_for_status()
-        res = resp.json()
-        if res["status"] in ["Failed", "Error", "Cancelled", "Terminated"]:
-            raise RuntimeError(f"SELREM job {job_id} failed or was cancelled")
-        if res["status"] == "Succeeded":
-            slr_url = res["outputs"]["main"]["output_path"]
-            ds = xr.open_dataset(slr_url, engine="zarr")
-            return ds
+        for analysis_mode in analysis_modes
+    }
@@ -0,0 +1,319 @@
+"""Helper functions for storing and loading mass balance and sea-level response datasets in access-optimized layouts."""
+
+import itertools
+import logging
+import shutil
+import tempfile
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+import zarr.codecs
+
+from dtc_is_notebook_helpers.mass_balance_variables import MASS_BALANCE_COL_NAME, MASS_BALANCE_ERROR_COL_NAME
+
+logger = logging.getLogger(__name__)
+
+# Size of the x/y tiles used for the point-optimized layout of annual SELREM outputs
+POINT_OPTIMIZED_TILE_SIZE = 16
+
+SLR_ACCESS_PATTERNS = ["map", "point"]
+
+# Attribute of point-optimized copies recording the URL of the SELREM output they were made from
+SOURCE_SLR_URL_ATTR = "source_slr_url"
+
+# Number of chunks fetched concurrently by download_dataset
+DEFAULT_DOWNLOAD_WORKERS = 16
+
+
+def write_point_optimized_copy(
+    annual_slr_ds: xr.Dataset, slr_url: str, store_path: str | Path, tile_size: int = POINT_OPTIMIZED_TILE_SIZE
+) -> Path:
+    """
+    Write a local copy of an annual SELREM dataset, rechunked for reading time series at single locations.
+
+    Each variable is stored in small x/y tiles spanning the full time dimension and compressed with a fast codec, so a
+    per-location read only decodes one small tile instead of every map. Variables are written one at a time to keep
+    memory usage bounded to a single variable.
+
+    The copy is written to a temporary store next to store_path and only moved into place once complete, so an
+    interrupted write never leaves a partial copy at store_path. The URL of the source dataset is recorded in the copy's
+    attributes, so open_annual_slr_dataset only uses the copy for the run it was made from.
+
+    Parameters
+    ----------
+    annual_slr_ds : xr.Dataset
+        Dataset containing annual sea-level response data from SELREM, with dimensions ("time", "x", "y"). Likely
+        output from run_selrem_module with analysis_mode="annual".
+    slr_url : str
+        The URL of the SELREM output annual_slr_ds was loaded from.
+    store_path : str | Path
+        Local path of the zarr store to write. Any existing store at this path is overwritten.
+    tile_size : int, optional
+        Size of the x/y tiles, by default POINT_OPTIMIZED_TILE_SIZE.
+
+    Returns
+    -------
+    Path
+        The path of the written zarr store.
+
+    Raises
+    ------
+    ValueError
+        If tile_size is not positive.
+    """
+    if tile_size < 1:
+        raise ValueError(f"tile_size must be positive. Got {tile_size}.")
+    store_path = Path(store_path)
+    store_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = Path(tempfile.mkdtemp(prefix=f".{store_path.name}.", dir=store_path.parent))
+    try:
+        compressor = zarr.codecs.BloscCodec(cname="lz4", clevel=1, shuffle="shuffle")
+        attrs = {**annual_slr_ds.attrs, SOURCE_SLR_URL_ATTR: slr_url}
+        coords_ds = xr.Dataset(coords=annual_slr_ds.coords, attrs=attrs).drop_encoding()
+        coords_ds.to_zarr(tmp_path, mode="w", consolidated=True)
+        for var_name, data_array in annual_slr_ds.data_vars.items():
+            chunks = tuple(
+                annual_slr_ds.sizes[dim] if dim == "time" else min(tile_size, annual_slr_ds.sizes[dim])
+                for dim in data_array.dims
+            )
+            # Appending replaces the attributes of the store, so they are written with every variable
+            var_ds = data_array.to_dataset().drop_vars(list(data_array.coords)).drop_encoding().load()
+            var_ds.attrs = attrs
+            var_ds.to_zarr(
+                tmp_path,
+                mode="a",
+                consolidated=True,
+                encoding={var_name: {"chunks": chunks, "compressors": (compressor,)}},
+            )
+        if store_path.exists():
+            # Move the old copy aside first, as a directory cannot be renamed onto a non-empty one
+            old_path = Path(tempfile.mkdtemp(prefix=f".{store_path.name}.old.", dir=store_path.parent))
+            store_path.rename(old_path / store_path.name)
+            tmp_path.rename(store_path)
+            shutil.rmtree(old_path, ignore_errors=True)
+        else:
+            tmp_path.rename(store_path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    return store_path
+
+
+def open_annual_slr_dataset(
+    slr_url: str, point_optimized_path: str | Path | None = None, access: str = "map"
+) -> xr.Dataset:
+    """
+    Open an annual SELREM dataset using the layout best suited to the query.
+
+    Parameters
+    ----------
+    slr_url : str
+        The URL of the map-optimized annual sea-level response dataset, as produced by SELREM.
+    point_optimized_path : str | Path | None, optional
+        Path of a point-optimized copy written by write_point_optimized_copy, by default None.
+    access : str, optional
+        The access pattern of the query, should be either "map" (whole fields per time step) or "point" (time series
+        at a few locations), by default "map". Point queries fall back to the map-optimized layout when no
+        point-optimized copy of slr_url exists, e.g. when the copy at point_optimized_path was made for another run.
+
+    Returns
+    -------
+    xr.Dataset
+        The lazily opened annual sea-level response dataset.
+
+    Raises
+    ------
+    ValueError
+        If an unknown access pattern is specified.
+    """
+    if access not in SLR_ACCESS_PATTERNS:
+        raise ValueError(f"Unknown access pattern: {access}")
+    if access == "point" and point_optimized_path is not None and Path(point_optimized_path).exists():
+        point_ds = xr.open_dataset(point_optimized_path, engine="zarr")
+        if point_ds.attrs.get(SOURCE_SLR_URL_ATTR) == slr_url:
+            return point_ds
+        point_ds.close()
+        logger.warning(
+            "Point-optimized copy at %s was not made from %s, reading the map-optimized layout instead",
+            point_optimized_path,
+            slr_url,
+        )
+    return xr.open_dataset(slr_url, engine="zarr")
+
+
+def _chunk_regions(shape: tuple[int, ...], chunks: tuple[int, ...], chunks_per_request: int) -> list[tuple[slice, ...]]:
+    """
+    Split an array into the regions read by individual download requests.
+
+    Parameters
+    ----------
+    shape : tuple[int, ...]
+        Shape of the array.
+    chunks : tuple[int, ...]
+        Chunk shape of the array in the store.
+    chunks_per_request : int
+        Number of consecutive chunks along the first dimension to coalesce into a single region.
+
+    Returns
+    -------
+    list[tuple[slice, ...]]
+        The regions covering the whole array.
+    """
+    steps = [max(1, min(chunk, size)) for chunk, size in zip(chunks, shape, strict=True)]
+    if steps:
+        steps[0] *= chunks_per_request
+    return [
+        tuple(slice(start, min(start + step, size)) for start, step, size in zip(starts, steps, shape, strict=True))
+        for starts in itertools.product(*(range(0, size, step) for size, step in zip(shape, steps, strict=True)))
+    ]
+
+
+def _read_region(variable: xr.Variable, region: tuple[slice, ...]) -> np.ndarray:
+    """
+    Read and decode a region of a lazily opened variable.
+
+    Parameters
+    ----------
+    variable : xr.Variable
+        The lazily opened variable.
+    region : tuple[slice, ...]
+        The region to read.
+
+    Returns
+    -------
+    np.ndarray
+        The decoded values in the region.
+    """
+    return variable[region].values
+
+
+def download_dataset(
+    url: str,
+    variables: list[str] | None = None,
+    max_workers: int = DEFAULT_DOWNLOAD_WORKERS,
+    chunks_per_request: int = 1,
+    progress_callback: Callable[[float, float, float], None] | None = None,
+) -> xr.Dataset:
+    """
+    Materialize a zarr dataset by fetching all chunks of all requested variables concurrently.
+
+    This is a faster alternative to xr.open_dataset(url, engine="zarr").compute() for remote datasets, which mostly
+    fetches chunks one at a time.
+
+    Parameters
+    ----------
+    url : str
+        The URL of the zarr dataset.
+    variables : list[str] | None, optional
+        The data variables to download, by default None (all data variables).
+    max_workers : int, optional
+        Maximum number of concurrent chunk requests, by default DEFAULT_DOWNLOAD_WORKERS.
+    chunks_per_request : int, optional
+        Number of consecutive chunks along the first dimension of each variable to coalesce into a single read, by
+        default 1 (no coalescing). Coalescing reduces the number of requests when chunks are small.
+    progress_callback : Callable[[float, float, float], None] | None, optional
+        Function called after each completed read with the downloaded MB, the total MB and the throughput in MB/s, by
+        default None.
+
+    Returns
+    -------
+    xr.Dataset
+        The dataset with all requested variables loaded into memory.
+
+    Raises
+    ------
+    ValueError
+        If max_workers or chunks_per_request is not positive.
+    """
+    if max_workers < 1:
+        raise ValueError(f"max_workers must be positive. Got {max_workers}.")
+    if chunks_per_request < 1:
+        raise ValueError(f"chunks_per_request must be positive. Got {chunks_per_request}.")
+    ds = xr.open_dataset(url, engine="zarr")
+    if variables is not None:
+        ds = ds[variables]
+    names = [name for name in ds.variables if name not in ds.indexes]
+    outputs = {name: np.empty(ds.variables[name].shape, dtype=ds.variables[name].dtype) for name in names}
+    total_mb = sum(output.nbytes for output in outputs.values()) / 1e6
+    downloaded_mb = 0.0
+    started = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {}
+        for name in names:
+            variable = ds.variables[name]
+            chunks = variable.encoding.get("chunks") or variable.shape
+            for region in _chunk_regions(variable.shape, chunks, chunks_per_request):
+                futures[executor.submit(_read_region, variable, region)] = (name, region)
+        for future in as_completed(futures):
+            name, region = futures[future]
+            data = future.result()
+            outputs[name][region] = data
+            downloaded_mb += data.nbytes / 1e6
+            if progress_callback is not None:
+                progress_callback(downloaded_mb, total_mb, downloaded_mb / max(time.perf_counter() - started, 1e-9))
+    finally:
+        # If the download is interrupted or fails, drop the reads that have not started instead of finishing them
+        executor.shutdown(wait=True, cancel_futures=True)
+    elapsed = time.perf_counter() - started
+    logger.info(
+        "Downloaded %.1f MB from %s in %.1f s (%.1f MB/s)",
+        downloaded_mb,
+        url,
+        elapsed,
+        downloaded_mb / max(elapsed, 1e-9),
+    )
+    return xr.Dataset(
+        {name: ds[name].variable.copy(data=outputs[name]) for name in ds.data_vars},
+        coords={
+            name: ds[name].variable if name in ds.indexes else ds[name].variable.copy(data=outputs[name])
+            for name in ds.coords
+        },
+        attrs=ds.attrs,
+    )
+
+
+def open_mass_balance_dataset(
+    dataset_url: str,
+    start_time: datetime | None = None,
+    end_time: datetime | None = None,
+    variables: list[str] | None = None,
+) -> xr.Dataset:
+    """
+    Load only the selected time window and variables of a mass balance dataset into memory.
+
+    The selection is applied to the lazily opened dataset before anything is materialized, so only the zarr chunks
+    intersecting the time window and variables are read, instead of the whole dataset as with
+    xr.open_dataset(dataset_url, engine="zarr").compute().
+
+    Parameters
+    ----------
+    dataset_url : str
+        The URL of the mass balance dataset.
+    start_time : datetime | None, optional
+        Start time of the window to load, by default None. If both start_time and end_time are provided, only the time
+        steps between them are loaded, matching compute_mean_mass_balance_over_time_window. Otherwise, all time steps
+        are loaded.
+    end_time : datetime | None, optional
+        End time of the window to load, by default None.
+    variables : list[str] | None, optional
+        The data variables to load, by default None (the mass balance and its uncertainty). The per-point 'x' and 'y'
+        coordinates are always loaded.
+
+    Returns
+    -------
+    xr.Dataset
+        The selected part of the mass balance dataset, loaded into memory.
+    """
+    if variables is None:
+        variables = [MASS_BALANCE_COL_NAME, MASS_BALANCE_ERROR_COL_NAME]
+    ds = xr.open_dataset(dataset_url, engine="zarr")
+    ds = ds[list(dict.fromkeys([*variables, *(name for name in ["x", "y"] if name in ds.variables)]))]
+    if start_time and end_time:
+        ds = ds.sel(time=slice(start_time, end_time))
+    return ds.load()
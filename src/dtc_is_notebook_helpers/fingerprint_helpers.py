@@ -0,0 +1,191 @@
+"""
+fingerprint_helpers.py.
+
+Helper functions for computing sea-level fingerprints locally by superposition of cached per-region SELREM responses.
+
+Sea-level fingerprints respond linearly to mass input. Once the SELREM response to a unit mass input (1 Gt/yr) in each
+region is known, the response to any regional weighting of the mass balance is a weighted sum of these unit responses,
+which is computed here as a single tensor contraction instead of a new SELREM run.
+"""
+
+import logging
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+
+import xarray as xr
+
+from dtc_is_notebook_helpers.api_helpers import prefetch_selrem_module
+
+logger = logging.getLogger(__name__)
+
+# Response fields that are linear in the mass input, and can therefore be superposed
+LINEAR_RESPONSE_VARIABLES = ["sdot", "ndot", "udot"]
+LINEAR_RESPONSE_GMSL_ATTRS = ["gmsl_sdot", "gmsl_ndot", "gmsl_udot"]
+
+
+def build_unit_response_basis(
+    region_responses: dict[str, xr.Dataset], region_mass_balance: dict[str, float]
+) -> xr.Dataset:
+    """
+    Normalize global SELREM responses of individual regions to a unit mass input and stack them along 'region'.
+
+    Parameters
+    ----------
+    region_responses : dict[str, xr.Dataset]
+        Global sea-level response of each region, keyed by region name. Likely output from run_selrem_module with
+        analysis_mode="global" for a mass balance dataset restricted to that region.
+    region_mass_balance : dict[str, float]
+        Total mass balance in Gt/yr that produced each region's response, keyed by region name.
+
+    Returns
+    -------
+    xr.Dataset
+        Dataset with a 'region' dimension holding the sdot, ndot and udot response per Gt/yr of each region, as well as
+        the global mean responses (gmsl_sdot, gmsl_ndot, gmsl_udot) when present in the region responses.
+
+    Raises
+    ------
+    ValueError
+        If the regions of region_responses and region_mass_balance differ, or a region has zero mass balance.
+    """
+    if set(region_responses) != set(region_mass_balance):
+        raise ValueError(
+            f"region_responses and region_mass_balance must have the same regions. Got {sorted(region_responses)} and "
+            f"{sorted(region_mass_balance)}."
+        )
+    unit_responses = []
+    for region, response_ds in region_responses.items():
+        mass_balance = region_mass_balance[region]
+        if mass_balance == 0:
+            raise ValueError(f"Mass balance of region {region} must be non-zero to normalize its response.")
+        unit_ds = response_ds[LINEAR_RESPONSE_VARIABLES] / mass_balance
+        for attr in LINEAR_RESPONSE_GMSL_ATTRS:
+            if attr in response_ds.attrs:
+                unit_ds[attr] = response_ds.attrs[attr] / mass_balance
+        unit_responses.append(unit_ds.drop_attrs().drop_encoding())
+    return xr.concat(unit_responses, dim="region").assign_coords(region=list(region_responses))
+
+
+def compute_unit_response_basis(
+    region_vmb_urls: dict[str, str],
+    region_mass_balance: dict[str, float],
+    start_year: int,
+    end_year: int,
+    basis_path: str | Path,
+) -> xr.Dataset:
+    """
+    Load the cached unit response basis from basis_path, or compute it with SELREM and cache it there.
+
+    The inputs of the basis (regions, their dataset URLs and mass balances, and the analysis period) are stored in its
+    'selrem_inputs' attribute. A cached basis computed from other inputs is recomputed and overwritten rather than
+    reused. The SELREM jobs of all regions are run concurrently, and if one of them fails, the others are cancelled.
+
+    Parameters
+    ----------
+    region_vmb_urls : dict[str, str]
+        URL of a mass balance dataset restricted to each region, keyed by region name.
+    region_mass_balance : dict[str, float]
+        Total mass balance in Gt/yr of each region's dataset over the analysis period, keyed by region name.
+    start_year : int
+        The start year for the analysis period.
+    end_year : int
+        The end year for the analysis period.
+    basis_path : str | Path
+        Local path of the zarr store caching the basis.
+
+    Returns
+    -------
+    xr.Dataset
+        The unit response basis, see build_unit_response_basis.
+
+    Raises
+    ------
+    ValueError
+        If the regions of region_vmb_urls and region_mass_balance differ.
+    """
+    if set(region_vmb_urls) != set(region_mass_balance):
+        raise ValueError(
+            f"region_vmb_urls and region_mass_balance must have the same regions. Got {sorted(region_vmb_urls)} and "
+            f"{sorted(region_mass_balance)}."
+        )
+    basis_path = Path(basis_path)
+    selrem_inputs = {
+        "regions": {
+            region: {"vmb_url": vmb_url, "mass_balance": float(region_mass_balance[region])}
+            for region, vmb_url in region_vmb_urls.items()
+        },
+        "start_year": start_year,
+        "end_year": end_year,
+    }
+    if basis_path.exists():
+        basis_ds = xr.open_dataset(basis_path, engine="zarr").load()
+        if basis_ds.attrs.get("selrem_inputs") == selrem_inputs:
+            return basis_ds
+        logger.warning("Unit response basis at %s was computed from other inputs, recomputing it", basis_path)
+    cancel_event = threading.Event()
+    futures = {
+        region: prefetch_selrem_module(
+            vmb_url, 1.0, start_year, end_year, analysis_modes=("global",), cancel_event=cancel_event
+        )["global"]
+        for region, vmb_url in region_vmb_urls.items()
+    }
+    try:
+        region_responses = {region: future.result().compute() for region, future in futures.items()}
+    except BaseException:
+        # Stop the SELREM jobs of the other regions, as the basis cannot be built without them
+        cancel_event.set()
+        raise
+    basis_ds = build_unit_response_basis(region_responses, region_mass_balance)
+    basis_ds.attrs["selrem_inputs"] = selrem_inputs
+    # Write to a temporary store first, so an interrupted write never leaves a partial basis at basis_path
+    basis_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = Path(tempfile.mkdtemp(prefix=f".{basis_path.name}.", dir=basis_path.parent))
+    try:
+        basis_ds.to_zarr(tmp_path, mode="w")
+        if basis_path.exists():
+            shutil.rmtree(basis_path)
+        tmp_path.rename(basis_path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    return basis_ds
+
+
+def superpose_unit_responses(basis_ds: xr.Dataset, weights: xr.DataArray) -> xr.Dataset:
+    """
+    Compute the sea-level response to an arbitrary regional weighting of the mass input.
+
+    Parameters
+    ----------
+    basis_ds : xr.Dataset
+        Unit response basis, likely output from build_unit_response_basis or compute_unit_response_basis.
+    weights : xr.DataArray
+        Mass balance in Gt/yr of each region, with a 'region' dimension and optionally others, such as 'time' or a
+        scenario dimension. Likely output from aggregate_mass_balance_by_region.
+
+    Returns
+    -------
+    xr.Dataset
+        The superposed sdot, ndot and udot responses (and global means, if in the basis), with the non-region dimensions
+        of weights followed by the spatial dimensions of the basis.
+
+    Raises
+    ------
+    ValueError
+        If weights has no 'region' dimension and coordinate, or refers to regions missing from the basis.
+    """
+    if "region" not in weights.coords or "region" not in weights.dims:
+        raise ValueError(f"weights must have a 'region' dimension and coordinate. Got dimensions {weights.dims}.")
+    missing_regions = {str(region) for region in weights["region"].values} - set(basis_ds["region"].values.astype(str))
+    if missing_regions:
+        raise ValueError(f"weights refer to regions missing from the basis: {sorted(missing_regions)}.")
+    basis_ds = basis_ds.sel(region=weights["region"].values)
+    fields = basis_ds[LINEAR_RESPONSE_VARIABLES].to_dataarray(dim="variable")
+    response_ds = xr.dot(weights, fields, dim="region").to_dataset(dim="variable")
+    gmsl_names = [name for name in LINEAR_RESPONSE_GMSL_ATTRS if name in basis_ds]
+    if gmsl_names:
+        gmsl = basis_ds[gmsl_names].to_dataarray(dim="variable")
+        response_ds = response_ds.merge(xr.dot(weights, gmsl, dim="region").to_dataset(dim="variable"))
+    return response_ds
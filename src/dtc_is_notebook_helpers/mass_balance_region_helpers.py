@@ -0,0 +1,487 @@
+"""
+mass_balance_region_helpers.py.
+
+Helper functions for aggregating point-based mass balance datasets over regions, such as drainage basins, latitude
+bands or user-drawn polygons.
+
+Regional aggregation is done in two steps: a region index assigning each point to a region is built once, after which
+the regional totals for every time step are computed with a single grouped reduction.
+
+Regional subsets (bounding boxes or polygons) are read through a spatial index, which sorts the points into
+fixed-size lon/lat tiles so that a query only visits the tiles it overlaps and only reads the matching points.
+"""
+
+import hashlib
+import logging
+from collections.abc import Sequence
+from pathlib import Path as FilePath
+
+import numpy as np
+import xarray as xr
+from matplotlib.path import Path
+
+from dtc_is_notebook_helpers.mass_balance_variables import MASS_BALANCE_COL_NAME, MASS_BALANCE_ERROR_COL_NAME
+
+logger = logging.getLogger(__name__)
+
+KG_PER_GT = 1e12
+
+# Region index value of points that do not belong to any region
+NO_REGION = -1
+
+# Size of the lon/lat tiles of the spatial index, in degrees
+SPATIAL_INDEX_TILE_SIZE = 1.0
+
+
+def build_latitude_band_index(lat: np.ndarray, band_edges: Sequence[float]) -> tuple[np.ndarray, list[str]]:
+    """
+    Assign each point to the latitude band it falls in.
+
+    Parameters
+    ----------
+    lat : np.ndarray
+        Latitude of each point in decimal degrees.
+    band_edges : Sequence[float]
+        Increasing latitude edges of the bands, e.g. [-90, 0, 90] to split the southern and northern hemispheres.
+        Bands include their lower edge and exclude their upper edge, except for the last band which includes both.
+
+    Returns
+    -------
+    tuple[np.ndarray, list[str]]
+        The region index of each point (NO_REGION for points outside all bands) and the name of each band.
+
+    Raises
+    ------
+    ValueError
+        If band_edges has fewer than two values or is not strictly increasing.
+    """
+    edges = np.asarray(band_edges, dtype=float)
+    if edges.size < 2 or np.any(np.diff(edges) <= 0):
+        raise ValueError(f"band_edges must contain at least two strictly increasing values. Got {list(band_edges)}.")
+    lat = np.asarray(lat, dtype=float)
+    region_index = np.digitize(lat, edges) - 1
+    region_index[lat == edges[-1]] = edges.size - 2
+    region_index[(region_index < 0) | (region_index >= edges.size - 1) | np.isnan(lat)] = NO_REGION
+    names = [f"{lower:g} to {upper:g}" for lower, upper in zip(edges[:-1], edges[1:], strict=True)]
+    return region_index, names
+
+
+def build_polygon_region_index(
+    lon: np.ndarray, lat: np.ndarray, polygons: dict[str, np.ndarray]
+) -> tuple[np.ndarray, list[str]]:
+    """
+    Assign each point to the polygon it falls in, e.g. drainage basins or user-drawn regions.
+
+    Parameters
+    ----------
+    lon : np.ndarray
+        Longitude of each point in decimal degrees.
+    lat : np.ndarray
+        Latitude of each point in decimal degrees.
+    polygons : dict[str, np.ndarray]
+        Polygon vertices as (n, 2) arrays of (lon, lat), keyed by region name. Points in overlapping polygons are
+        assigned to the first matching polygon.
+
+    Returns
+    -------
+    tuple[np.ndarray, list[str]]
+        The region index of each point (NO_REGION for points outside all polygons) and the name of each region.
+    """
+    points = np.column_stack([np.asarray(lon, dtype=float), np.asarray(lat, dtype=float)])
+    region_index = np.full(len(points), NO_REGION, dtype=int)
+    for i, vertices in enumerate(polygons.values()):
+        inside = Path(np.asarray(vertices, dtype=float)).contains_points(points)
+        region_index[inside & (region_index == NO_REGION)] = i
+    return region_index, list(polygons)
+
+
+def _grouped_sum(values: np.ndarray, region_index: np.ndarray, n_regions: int) -> np.ndarray:
+    """
+    Sum values over the points of each region, for all remaining dimensions at once, skipping NaNs.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        Values with the point dimension first, shape (n_points, ...).
+    region_index : np.ndarray
+        The region index of each point.
+    n_regions : int
+        The number of regions.
+
+    Returns
+    -------
+    np.ndarray
+        Regional sums with shape (n_regions, ...).
+    """
+    trailing_shape = values.shape[1:]
+    flat_values = values.reshape(len(values), -1)
+    n_columns = flat_values.shape[1]
+    in_region = region_index != NO_REGION
+    flat_values = flat_values[in_region]
+    bins = (region_index[in_region, None] * n_columns + np.arange(n_columns)).ravel()
+    sums = np.bincount(bins, weights=np.nan_to_num(flat_values.ravel()), minlength=n_regions * n_columns)
+    return sums.reshape((n_regions, *trailing_shape))
+
+
+def aggregate_mass_balance_by_region(
+    mass_balance_ds: xr.Dataset, region_index: np.ndarray, region_names: list[str]
+) -> xr.Dataset:
+    """
+    Compute the total mass balance and uncertainty of each region for every time step.
+
+    Totals are converted from kg/yr to Gt/yr, matching the continent-wide totals shown in the notebook. As in those
+    totals, uncertainties are summed linearly and NaN values are skipped.
+
+    Parameters
+    ----------
+    mass_balance_ds : xr.Dataset
+        Point-based mass balance dataset, with or without a time dimension.
+    region_index : np.ndarray
+        The region index of each point, likely output from build_latitude_band_index or build_polygon_region_index.
+    region_names : list[str]
+        The name of each region, in region index order.
+
+    Returns
+    -------
+    xr.Dataset
+        Dataset with a 'region' dimension (and 'time', if present in mass_balance_ds) holding the regional mass balance
+        and uncertainty in Gt/yr.
+
+    Raises
+    ------
+    ValueError
+        If region_index does not have one entry per point.
+    """
+    if len(region_index) != mass_balance_ds.sizes["point"]:
+        raise ValueError(
+            f"region_index must have one entry per point. Got {len(region_index)} for "
+            f"{mass_balance_ds.sizes['point']} points."
+        )
+    data_vars = {}
+    for var_name in [MASS_BALANCE_COL_NAME, MASS_BALANCE_ERROR_COL_NAME]:
+        data_array = mass_balance_ds[var_name].transpose("point", ...)
+        sums = _grouped_sum(data_array.values, region_index, len(region_names)) / KG_PER_GT
+        data_vars[var_name] = (["region", *data_array.dims[1:]], sums, {"units": "Gt/yr"})
+    coords = {"region": region_names}
+    if "time" in mass_balance_ds.dims:
+        coords["time"] = mass_balance_ds["time"].values
+    return xr.Dataset(data_vars, coords=coords)
+
+
+def build_spatial_index(mass_balance_ds: xr.Dataset, tile_size: float = SPATIAL_INDEX_TILE_SIZE) -> xr.Dataset:
+    """
+    Build a spatial index of the points of a mass balance dataset, sorted by lon/lat tile.
+
+    The index is itself a small dataset that can be persisted alongside the mass balance dataset, e.g. with to_zarr or
+    through load_or_build_spatial_index.
+
+    Parameters
+    ----------
+    mass_balance_ds : xr.Dataset
+        Point-based mass balance dataset with 'x' (longitude) and 'y' (latitude) values per point.
+    tile_size : float, optional
+        Size of the lon/lat tiles in degrees, by default SPATIAL_INDEX_TILE_SIZE.
+
+    Returns
+    -------
+    xr.Dataset
+        Dataset holding the point indices sorted by tile ('point_order'), their longitude and latitude, and the offset
+        of the first sorted point of each tile ('tile_start').
+
+    Raises
+    ------
+    ValueError
+        If tile_size is not positive.
+    """
+    if tile_size <= 0:
+        raise ValueError(f"tile_size must be positive. Got {tile_size}.")
+    lon, lat = _point_coordinates(mass_balance_ds)
+    n_lon_tiles = int(np.ceil(360 / tile_size))
+    n_lat_tiles = int(np.ceil(180 / tile_size))
+    tile_id = _tile_rows(lat, tile_size, n_lat_tiles) * n_lon_tiles + _tile_columns(lon, tile_size, n_lon_tiles)
+    point_order = np.argsort(tile_id, kind="stable")
+    tile_start = np.searchsorted(tile_id[point_order], np.arange(n_lon_tiles * n_lat_tiles + 1))
+    return xr.Dataset(
+        {
+            "point_order": (["sorted_point"], point_order),
+            "lon": (["sorted_point"], lon[point_order]),
+            "lat": (["sorted_point"], lat[point_order]),
+            "tile_start": (["tile_edge"], tile_start),
+        },
+        attrs={
+            "tile_size": tile_size,
+            "n_lon_tiles": n_lon_tiles,
+            "n_lat_tiles": n_lat_tiles,
+            "n_points": len(lon),
+            "points_hash": _points_hash(lon, lat),
+        },
+    )
+
+
+def _point_coordinates(mass_balance_ds: xr.Dataset) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return the longitude and latitude of each point of a mass balance dataset.
+
+    Parameters
+    ----------
+    mass_balance_ds : xr.Dataset
+        Point-based mass balance dataset with 'x' (longitude) and 'y' (latitude) values per point.
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        The longitude and latitude of each point, as float arrays.
+    """
+    return np.asarray(mass_balance_ds["x"].values, dtype=float), np.asarray(mass_balance_ds["y"].values, dtype=float)
+
+
+def _points_hash(lon: np.ndarray, lat: np.ndarray) -> str:
+    """
+    Return a hash of the point locations, identifying the dataset a spatial index was built for.
+
+    Parameters
+    ----------
+    lon : np.ndarray
+        Longitude of each point as a float array.
+    lat : np.ndarray
+        Latitude of each point as a float array.
+
+    Returns
+    -------
+    str
+        Hex digest of the point locations.
+    """
+    digest = hashlib.sha256(np.ascontiguousarray(lon).tobytes())
+    digest.update(np.ascontiguousarray(lat).tobytes())
+    return digest.hexdigest()
+
+
+def _tile_columns(lon: np.ndarray, tile_size: float, n_lon_tiles: int) -> np.ndarray:
+    """
+    Return the tile column of each longitude.
+
+    Parameters
+    ----------
+    lon : np.ndarray
+        Longitudes in decimal degrees, between -180 and 180.
+    tile_size : float
+        Size of the tiles in degrees.
+    n_lon_tiles : int
+        Number of tile columns.
+
+    Returns
+    -------
+    np.ndarray
+        The tile column of each longitude.
+    """
+    return np.clip(np.floor((np.nan_to_num(lon) + 180) / tile_size), 0, n_lon_tiles - 1).astype(int)
+
+
+def _tile_rows(lat: np.ndarray, tile_size: float, n_lat_tiles: int) -> np.ndarray:
+    """
+    Return the tile row of each latitude.
+
+    Parameters
+    ----------
+    lat : np.ndarray
+        Latitudes in decimal degrees, between -90 and 90.
+    tile_size : float
+        Size of the tiles in degrees.
+    n_lat_tiles : int
+        Number of tile rows.
+
+    Returns
+    -------
+    np.ndarray
+        The tile row of each latitude.
+    """
+    return np.clip(np.floor((np.nan_to_num(lat) + 90) / tile_size), 0, n_lat_tiles - 1).astype(int)
+
+
+def load_or_build_spatial_index(
+    mass_balance_ds: xr.Dataset, index_path: str | FilePath, tile_size: float = SPATIAL_INDEX_TILE_SIZE
+) -> xr.Dataset:
+    """
+    Load a persisted spatial index, or build it and write it to index_path if it does not exist yet.
+
+    The persisted index is only used if it was built for the same points as mass_balance_ds, which is checked against
+    the number of points and a hash of their locations stored in the index. Otherwise, e.g. when index_path holds the
+    index of another dataset or of an older version of this one, the index is rebuilt and overwritten.
+
+    Parameters
+    ----------
+    mass_balance_ds : xr.Dataset
+        Point-based mass balance dataset the index belongs to.
+    index_path : str | FilePath
+        Local path of the zarr store holding the index, e.g. next to a local copy of the mass balance dataset.
+    tile_size : float, optional
+        Size of the lon/lat tiles in degrees when building a new index, by default SPATIAL_INDEX_TILE_SIZE.
+
+    Returns
+    -------
+    xr.Dataset
+        The spatial index, loaded into memory.
+    """
+    if FilePath(index_path).exists():
+        index_ds = xr.open_dataset(index_path, engine="zarr").load()
+        lon, lat = _point_coordinates(mass_balance_ds)
+        if index_ds.attrs.get("n_points") == len(lon) and index_ds.attrs.get("points_hash") == _points_hash(lon, lat):
+            return index_ds
+        logger.warning("Spatial index at %s was built for other points, rebuilding it", index_path)
+    index_ds = build_spatial_index(mass_balance_ds, tile_size)
+    index_ds.to_zarr(index_path, mode="w")
+    return index_ds
+
+
+def _query_bbox_sorted_positions(
+    index_ds: xr.Dataset, lon_min: float, lon_max: float, lat_min: float, lat_max: float
+) -> np.ndarray:
+    """
+    Return the positions in the spatial index of the points within a lon/lat bounding box.
+
+    Parameters
+    ----------
+    index_ds : xr.Dataset
+        Spatial index, likely output from build_spatial_index or load_or_build_spatial_index.
+    lon_min : float
+        Western edge of the bounding box in decimal degrees.
+    lon_max : float
+        Eastern edge of the bounding box in decimal degrees.
+    lat_min : float
+        Southern edge of the bounding box in decimal degrees.
+    lat_max : float
+        Northern edge of the bounding box in decimal degrees.
+
+    Returns
+    -------
+    np.ndarray
+        Positions along the 'sorted_point' dimension of the index of the points within the bounding box.
+
+    Raises
+    ------
+    ValueError
+        If the bounding box is empty.
+    """
+    if lon_min > lon_max or lat_min > lat_max:
+        raise ValueError(f"Invalid bounding box: lon {lon_min} to {lon_max}, lat {lat_min} to {lat_max}.")
+    tile_size = index_ds.attrs["tile_size"]
+    n_lon_tiles = index_ds.attrs["n_lon_tiles"]
+    n_lat_tiles = index_ds.attrs["n_lat_tiles"]
+    tile_start = index_ds["tile_start"].values
+    first_column, last_column = _tile_columns(np.array([lon_min, lon_max]), tile_size, n_lon_tiles)
+    first_row, last_row = _tile_rows(np.array([lat_min, lat_max]), tile_size, n_lat_tiles)
+    # Within a tile row, the overlapped tiles are consecutive and so are their sorted points
+    rows = np.arange(first_row, last_row + 1)
+    range_starts = tile_start[rows * n_lon_tiles + first_column]
+    range_ends = tile_start[rows * n_lon_tiles + last_column + 1]
+    candidates = np.concatenate([np.arange(start, end) for start, end in zip(range_starts, range_ends, strict=True)])
+    lon = index_ds["lon"].values[candidates]
+    lat = index_ds["lat"].values[candidates]
+    return candidates[(lon >= lon_min) & (lon <= lon_max) & (lat >= lat_min) & (lat <= lat_max)]
+
+
+def query_bbox_point_indices(
+    index_ds: xr.Dataset, lon_min: float, lon_max: float, lat_min: float, lat_max: float
+) -> np.ndarray:
+    """
+    Return the indices of the points within a lon/lat bounding box, only visiting the tiles it overlaps.
+
+    Parameters
+    ----------
+    index_ds : xr.Dataset
+        Spatial index, likely output from build_spatial_index or load_or_build_spatial_index.
+    lon_min : float
+        Western edge of the bounding box in decimal degrees.
+    lon_max : float
+        Eastern edge of the bounding box in decimal degrees. Bounding boxes crossing the antimeridian are not supported.
+    lat_min : float
+        Southern edge of the bounding box in decimal degrees.
+    lat_max : float
+        Northern edge of the bounding box in decimal degrees.
+
+    Returns
+    -------
+    np.ndarray
+        Sorted indices along the 'point' dimension of the points within the bounding box (edges included).
+    """
+    positions = _query_bbox_sorted_positions(index_ds, lon_min, lon_max, lat_min, lat_max)
+    return np.sort(index_ds["point_order"].values[positions])
+
+
+def query_polygon_point_indices(index_ds: xr.Dataset, vertices: np.ndarray) -> np.ndarray:
+    """
+    Return the indices of the points within a lon/lat polygon, only visiting the tiles its bounding box overlaps.
+
+    Parameters
+    ----------
+    index_ds : xr.Dataset
+        Spatial index, likely output from build_spatial_index or load_or_build_spatial_index.
+    vertices : np.ndarray
+        Polygon vertices as an (n, 2) array of (lon, lat).
+
+    Returns
+    -------
+    np.ndarray
+        Sorted indices along the 'point' dimension of the points within the polygon.
+    """
+    vertices = np.asarray(vertices, dtype=float)
+    lon_min, lat_min = vertices.min(axis=0)
+    lon_max, lat_max = vertices.max(axis=0)
+    positions = _query_bbox_sorted_positions(index_ds, lon_min, lon_max, lat_min, lat_max)
+    points = np.column_stack([index_ds["lon"].values[positions], index_ds["lat"].values[positions]])
+    inside = Path(vertices).contains_points(points)
+    return np.sort(index_ds["point_order"].values[positions[inside]])
+
+
+def subset_by_bbox(
+    mass_balance_ds: xr.Dataset, index_ds: xr.Dataset, lon_min: float, lon_max: float, lat_min: float, lat_max: float
+) -> xr.Dataset:
+    """
+    Select the points of a mass balance dataset within a lon/lat bounding box.
+
+    The selection is lazy, so for datasets opened from zarr only the chunks holding the matching points are read.
+
+    Parameters
+    ----------
+    mass_balance_ds : xr.Dataset
+        Point-based mass balance dataset.
+    index_ds : xr.Dataset
+        Spatial index of mass_balance_ds.
+    lon_min : float
+        Western edge of the bounding box in decimal degrees.
+    lon_max : float
+        Eastern edge of the bounding box in decimal degrees.
+    lat_min : float
+        Southern edge of the bounding box in decimal degrees.
+    lat_max : float
+        Northern edge of the bounding box in decimal degrees.
+
+    Returns
+    -------
+    xr.Dataset
+        The points of mass_balance_ds within the bounding box.
+    """
+    return mass_balance_ds.isel(point=query_bbox_point_indices(index_ds, lon_min, lon_max, lat_min, lat_max))
+
+
+def subset_by_polygon(mass_balance_ds: xr.Dataset, index_ds: xr.Dataset, vertices: np.ndarray) -> xr.Dataset:
+    """
+    Select the points of a mass balance dataset within a lon/lat polygon.
+
+    The selection is lazy, so for datasets opened from zarr only the chunks holding the matching points are read.
+
+    Parameters
+    ----------
+    mass_balance_ds : xr.Dataset
+        Point-based mass balance dataset.
+    index_ds : xr.Dataset
+        Spatial index of mass_balance_ds.
+    vertices : np.ndarray
+        Polygon vertices as an (n, 2) array of (lon, lat).
+
+    Returns
+    -------
+    xr.Dataset
+        The points of mass_balance_ds within the polygon.
+    """
+    return mass_balance_ds.isel(point=query_polygon_point_indices(index_ds, vertices))
@@ -0,0 +1,4 @@
+"""Names of the variables of mass balance datasets, usable without importing the plotting dependencies."""
+
+MASS_BALANCE_COL_NAME = "land_ice_surface_specific_mass_balance_flux"
+MASS_BALANCE_ERROR_COL_NAME = "land_ice_surface_specific_mass_balance_flux_uncertainty"
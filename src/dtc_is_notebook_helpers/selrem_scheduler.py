@@ -0,0 +1,162 @@
+"""Scheduler that debounces SELREM requests from interactive widgets and only runs the latest one."""
+
+import threading
+from collections.abc import Callable
+from concurrent.futures import CancelledError
+
+import xarray as xr
+
+from dtc_is_notebook_helpers.api_helpers import run_selrem_module
+
+# Seconds a parameter must stay unchanged before a SELREM job is submitted for it
+DEFAULT_DEBOUNCE_SECONDS = 1.0
+
+
+class SelremRequestScheduler:
+    """
+    Coalesce rapid scaling factor changes into a single SELREM run for the latest value.
+
+    Every call to submit restarts a debounce timer, and only the value present when the timer fires is sent to SELREM.
+    A job that is still running when a new value is submitted is stale: it is cancelled on the server and its result,
+    should it still arrive, is ignored.
+
+    Parameters
+    ----------
+    vmb_url : str
+        The S3 URL of the volume mass balance dataset.
+    start_year : int
+        The start year for the analysis period.
+    end_year : int
+        The end year for the analysis period.
+    analysis_mode : str, optional
+        The analysis mode to use, should be either "global" or "annual", by default "annual".
+    on_result : Callable[[float, xr.Dataset], None] | None, optional
+        Function called with the scaling factor and sea-level response dataset of the latest request once it finishes,
+        by default None.
+    on_error : Callable[[float, Exception], None] | None, optional
+        Function called with the scaling factor and exception if the latest request fails, by default None.
+    debounce_seconds : float, optional
+        Seconds a value must stay unchanged before it is submitted, by default DEFAULT_DEBOUNCE_SECONDS.
+    """
+
+    def __init__(
+        self,
+        vmb_url: str,
+        start_year: int,
+        end_year: int,
+        analysis_mode: str = "annual",
+        on_result: Callable[[float, xr.Dataset], None] | None = None,
+        on_error: Callable[[float, Exception], None] | None = None,
+        debounce_seconds: float = DEFAULT_DEBOUNCE_SECONDS,
+    ) -> None:
+        self.vmb_url = vmb_url
+        self.start_year = start_year
+        self.end_year = end_year
+        self.analysis_mode = analysis_mode
+        self.on_result = on_result
+        self.on_error = on_error
+        self.debounce_seconds = debounce_seconds
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._timer: threading.Timer | None = None
+        self._pending_scale: float | None = None
+        self._running_scale: float | None = None
+        self._cancel_event: threading.Event | None = None
+
+    @property
+    def pending_scale(self) -> float | None:
+        """Scaling factor waiting for the debounce timer, if any."""
+        return self._pending_scale
+
+    @property
+    def running_scale(self) -> float | None:
+        """Scaling factor of the SELREM job currently running, if any."""
+        return self._running_scale
+
+    @property
+    def status(self) -> str:
+        """Current state of the scheduler: "debouncing", "running" or "idle"."""
+        with self._lock:
+            if self._pending_scale is not None:
+                return "debouncing"
+            if self._running_scale is not None:
+                return "running"
+            return "idle"
+
+    def submit(self, scale: float) -> None:
+        """
+        Request a SELREM run for a new scaling factor, superseding any earlier request.
+
+        Parameters
+        ----------
+        scale : float
+            The scaling factor to apply to the mass balance data.
+        """
+        with self._lock:
+            self._generation += 1
+            self._pending_scale = scale
+            self._cancel_pending_work()
+            self._timer = threading.Timer(self.debounce_seconds, self._run, args=(self._generation,))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def cancel(self) -> None:
+        """Drop the pending request and cancel the running SELREM job, if any."""
+        with self._lock:
+            self._generation += 1
+            self._pending_scale = None
+            self._cancel_pending_work()
+
+    def _cancel_pending_work(self) -> None:
+        """Stop the debounce timer and signal the running job to cancel. Must be called with the lock held."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._cancel_event is not None:
+            self._cancel_event.set()
+
+    def _run(self, generation: int) -> None:
+        """
+        Run the SELREM job for the request with the given generation, unless it has been superseded.
+
+        Parameters
+        ----------
+        generation : int
+            The generation of the request that started the debounce timer.
+        """
+        with self._lock:
+            if generation != self._generation:
+                return
+            scale = self._pending_scale
+            cancel_event = threading.Event()
+            self._pending_scale = None
+            self._running_scale = scale
+            self._cancel_event = cancel_event
+            self._timer = None
+        result = error = None
+        try:
+            result = run_selrem_module(
+                self.vmb_url,
+                scale,
+                self.start_year,
+                self.end_year,
+                self.analysis_mode,
+                cancel_event=cancel_event,
+            )
+        except CancelledError:
+            pass
+        except Exception as e:
+            # Reported through on_error, as there is no caller to raise to in the timer thread
+            error = e
+        finally:
+            with self._lock:
+                is_latest = generation == self._generation
+                if self._cancel_event is cancel_event:
+                    self._running_scale = None
+                    self._cancel_event = None
+        if not is_latest:
+            return
+        if error is not None and self.on_error is not None:
+            self.on_error(scale, error)
+        elif result is not None and self.on_result is not None:
+            self.on_result(scale, result)
@@ -0,0 +1,650 @@
+"""
+shared_store.py.
+
+Opt-in store for sharing materialized mass balance and SELREM datasets between Jupyter kernels on the same node.
+
+Datasets are published as memory-mapped .npy files in a directory on shared memory (/dev/shm when available), keyed by
+a hash of their content, so identical datasets are only stored once. Other kernels attach to them zero-copy as
+read-only xarray Datasets. Each attaching process leaves a reference marker in the entry, and entries without live
+references can be evicted.
+
+By default, the store is shared between the kernels of all users on the node. The directories every kernel writes to
+(the store itself, and the aliases and reference markers) are world-writable with the sticky bit set, like /tmp, and
+entries are world-readable, but only their publisher can evict them. Entries and aliases are only trusted when they
+were published by you, or by a user or group listed in DTC_SHARED_STORE_TRUSTED_UIDS or DTC_SHARED_STORE_TRUSTED_GIDS
+(comma-separated IDs). Entries published by anyone else are checked against their content key and copied into memory
+instead of being attached zero-copy, and their aliases are ignored. Set DTC_SHARED_STORE_DIR to use another directory
+instead: its permissions are left as they are and apply to the whole store, so a directory only you can access keeps
+published datasets private, and a directory shared with a group shares them with that group only. The store relies on
+POSIX file locking and on /proc to check which user runs a process, so it is only supported on Linux.
+"""
+
+import contextlib
+import datetime
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import stat
+import tempfile
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+
+# Shared memory is world-visible on purpose here, as the store is meant to be read by all kernels on the node
+_SHM_DIR = Path("/dev/shm")  # noqa: S108
+_NODE_SHARED_STORE_DIR = (_SHM_DIR if _SHM_DIR.is_dir() else Path(tempfile.gettempdir())) / "dtc_is_notebooks"
+DEFAULT_SHARED_STORE_DIR = Path(os.environ.get("DTC_SHARED_STORE_DIR", _NODE_SHARED_STORE_DIR))
+
+# Permissions of the directories all users of the node-wide store write to (sticky, so users can only remove their own
+# files), and the widest permissions of entries
+_SHARED_DIR_MODE = 0o1777
+_ENTRY_DIR_MODE = 0o755
+_ENTRY_FILE_MODE = 0o644
+
+# Users and groups, besides the current user, whose entries and aliases are trusted
+_TRUSTED_UIDS = frozenset(int(uid) for uid in os.environ.get("DTC_SHARED_STORE_TRUSTED_UIDS", "").split(",") if uid)
+_TRUSTED_GIDS = frozenset(int(gid) for gid in os.environ.get("DTC_SHARED_STORE_TRUSTED_GIDS", "").split(",") if gid)
+
+_PROC_DIR = Path("/proc")
+
+# Number of attachments per (store_dir, key) in this process
+_ATTACHED: dict[tuple[Path, str], int] = {}
+
+
+def _make_shared_dir(path: Path, mode: int) -> None:
+    """
+    Create a directory of the store that all its users can write to, if it does not exist yet.
+
+    Parameters
+    ----------
+    path : Path
+        The path of the directory.
+    mode : int
+        The permissions of the directory.
+    """
+    path.mkdir(parents=True, exist_ok=True)
+    if path.stat().st_uid == os.getuid():
+        # Only the owner can change the permissions, and the umask may have restricted them at creation
+        os.chmod(path, mode)
+
+
+def _entry_modes(dir_mode: int) -> tuple[int, int]:
+    """
+    Return the permissions of entry directories and files, readable by everyone who can use the store.
+
+    Parameters
+    ----------
+    dir_mode : int
+        The permissions of the directories all users of the store write to.
+
+    Returns
+    -------
+    tuple[int, int]
+        The permissions of entry directories and of entry files.
+    """
+    return (dir_mode & _ENTRY_DIR_MODE) | stat.S_IRWXU, (dir_mode & _ENTRY_FILE_MODE) | stat.S_IRUSR | stat.S_IWUSR
+
+
+def _is_trusted(path: Path) -> bool:
+    """
+    Return whether a file or directory of the store was created by the current user or a trusted user or group.
+
+    Symbolic links are never trusted, as anyone can create one pointing to a trusted path.
+
+    Parameters
+    ----------
+    path : Path
+        The path of the file or directory.
+
+    Returns
+    -------
+    bool
+        Whether the contents of the path can be trusted.
+    """
+    try:
+        path_stat = path.lstat()
+    except FileNotFoundError:
+        return False
+    if stat.S_ISLNK(path_stat.st_mode):
+        return False
+    return path_stat.st_uid == os.getuid() or path_stat.st_uid in _TRUSTED_UIDS or path_stat.st_gid in _TRUSTED_GIDS
+
+
+def _is_content_key(key: str) -> bool:
+    """
+    Return whether a string has the form of a content key, so it can safely be used as the name of an entry.
+
+    Parameters
+    ----------
+    key : str
+        The string.
+
+    Returns
+    -------
+    bool
+        Whether the string is a hex digest as returned by dataset_content_key.
+    """
+    return len(key) == 2 * hashlib.sha256().digest_size and all(char in "0123456789abcdef" for char in key)
+
+
+@contextlib.contextmanager
+def _store_lock(store_dir: Path, exclusive: bool) -> Iterator[int]:
+    """
+    Hold a lock on the store, shared by attaching and publishing processes and exclusive while evicting.
+
+    This ensures that an entry cannot be evicted between the moment a process finds it and the moment it leaves its
+    reference marker.
+
+    Parameters
+    ----------
+    store_dir : Path
+        The directory of the store.
+    exclusive : bool
+        Whether to take the lock exclusively.
+
+    Yields
+    ------
+    int
+        The permissions of the directories all users of the store write to, while the lock is held. Only the node-wide
+        default store is made world-writable; the store directory keeps its own permissions otherwise.
+    """
+    if store_dir == _NODE_SHARED_STORE_DIR:
+        dir_mode = _SHARED_DIR_MODE
+        _make_shared_dir(store_dir, dir_mode)
+    else:
+        store_dir.mkdir(parents=True, exist_ok=True)
+        dir_mode = stat.S_IMODE(store_dir.stat().st_mode)
+    lock_fd = os.open(store_dir / ".lock", os.O_RDONLY | os.O_CREAT, _entry_modes(dir_mode)[1])
+    try:
+        fcntl.flock(lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield dir_mode
+    finally:
+        # Closing the file releases the lock
+        os.close(lock_fd)
+
+
+def _json_default(value: object) -> object:
+    """
+    Convert numpy values, dates and times in dataset attributes to JSON serializable values.
+
+    Dates, times and durations are converted to ISO 8601 strings, and numpy values to the equivalent Python values.
+
+    Parameters
+    ----------
+    value : object
+        The value json could not serialize.
+
+    Returns
+    -------
+    object
+        The JSON serializable value.
+
+    Raises
+    ------
+    TypeError
+        If the value cannot be converted.
+    """
+    if isinstance(value, np.datetime64 | np.timedelta64):
+        return str(value)
+    if isinstance(value, np.ndarray) and value.dtype.kind in "mM":
+        return value.astype(str).tolist()
+    if isinstance(value, np.generic | np.ndarray):
+        return value.tolist()
+    if isinstance(value, datetime.date | datetime.time):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return str(np.timedelta64(value))
+    raise TypeError(
+        f"Attribute value of type {type(value).__name__} cannot be stored in the shared store. Convert it to a JSON "
+        "serializable value (e.g. a string) first."
+    )
+
+
+def _dataset_metadata(ds: xr.Dataset) -> dict:
+    """
+    Return the structure of a dataset (variables, dimensions, attributes) without its data.
+
+    Parameters
+    ----------
+    ds : xr.Dataset
+        The dataset.
+
+    Returns
+    -------
+    dict
+        The structure of the dataset, serializable to JSON.
+    """
+    return {
+        "attrs": ds.attrs,
+        "variables": [
+            {
+                "name": name,
+                "dims": list(variable.dims),
+                "attrs": variable.attrs,
+                "is_coord": name in ds.coords,
+            }
+            for name, variable in ds.variables.items()
+        ],
+    }
+
+
+def _content_key(metadata: dict, arrays: Iterable[np.ndarray]) -> str:
+    """
+    Return the content key of a dataset given its structure and the data of its variables.
+
+    Parameters
+    ----------
+    metadata : dict
+        The structure of the dataset, as returned by _dataset_metadata.
+    arrays : Iterable[np.ndarray]
+        The data of the variables of the dataset, in the order of metadata["variables"].
+
+    Returns
+    -------
+    str
+        Hex digest of the structure and data of the dataset.
+    """
+    digest = hashlib.sha256(json.dumps(metadata, default=_json_default, sort_keys=True).encode())
+    for array in arrays:
+        values = np.ascontiguousarray(array)
+        digest.update(f"{values.dtype.str}{values.shape}".encode())
+        digest.update(values.view(np.uint8).reshape(-1) if values.size else b"")
+    return digest.hexdigest()
+
+
+def dataset_content_key(ds: xr.Dataset) -> str:
+    """
+    Return a key identifying a dataset by its content.
+
+    Parameters
+    ----------
+    ds : xr.Dataset
+        The dataset, loaded into memory.
+
+    Returns
+    -------
+    str
+        Hex digest of the structure and data of the dataset.
+    """
+    return _content_key(_dataset_metadata(ds), (variable.values for variable in ds.variables.values()))
+
+
+def _alias_path(store_dir: Path, alias: str, uid: int | None = None) -> Path:
+    """
+    Return the path of the file mapping an alias to a content key.
+
+    Each user publishes aliases in a directory of their own, so that users cannot overwrite each other's aliases.
+
+    Parameters
+    ----------
+    store_dir : Path
+        The directory of the store.
+    alias : str
+        The alias, e.g. the URL the dataset was loaded from.
+    uid : int | None, optional
+        The user who published the alias, by default the current user.
+
+    Returns
+    -------
+    Path
+        The path of the alias file.
+    """
+    uid = os.getuid() if uid is None else uid
+    return store_dir / "aliases" / str(uid) / hashlib.sha256(alias.encode()).hexdigest()
+
+
+def _resolve_key(store_dir: Path, key_or_alias: str) -> str:
+    """
+    Return the content key of a published dataset given its content key or alias.
+
+    Aliases published by the current user take precedence over those of trusted users. Aliases published by other
+    users are ignored.
+
+    Parameters
+    ----------
+    store_dir : Path
+        The directory of the store.
+    key_or_alias : str
+        The content key or alias of the dataset.
+
+    Returns
+    -------
+    str
+        The content key.
+
+    Raises
+    ------
+    KeyError
+        If no dataset is published under key_or_alias.
+    """
+    if _is_content_key(key_or_alias) and (store_dir / key_or_alias / "metadata.json").exists():
+        return key_or_alias
+    alias_path = _alias_path(store_dir, key_or_alias)
+    aliases_dir = alias_path.parent.parent
+    alias_paths = [alias_path]
+    if aliases_dir.is_dir():
+        alias_paths += sorted(
+            user_dir / alias_path.name for user_dir in aliases_dir.iterdir() if user_dir != alias_path.parent
+        )
+    for alias_path in alias_paths:
+        # Both the directory and the file are checked, as files can be moved between directories of their owner
+        if not (_is_trusted(alias_path.parent) and _is_trusted(alias_path)):
+            continue
+        try:
+            key = alias_path.read_text()
+        except FileNotFoundError:
+            # Removed by its publisher in the meantime
+            continue
+        if _is_content_key(key) and (store_dir / key / "metadata.json").exists():
+            return key
+    raise KeyError(f"No shared dataset published as {key_or_alias} in {store_dir}")
+
+
+def _read_entry(entry_dir: Path, key: str, trusted: bool) -> xr.Dataset:
+    """
+    Read an entry of the store, memory-mapping its files if it is trusted.
+
+    Untrusted entries are copied into memory and checked against their content key instead, as their owner could still
+    modify memory-mapped files after they were checked.
+
+    Parameters
+    ----------
+    entry_dir : Path
+        The directory of the entry.
+    key : str
+        The content key of the entry.
+    trusted : bool
+        Whether the entry was published by the current user or a trusted user or group.
+
+    Returns
+    -------
+    xr.Dataset
+        The dataset. Its arrays are read-only.
+
+    Raises
+    ------
+    ValueError
+        If an untrusted entry does not hold the dataset identified by its content key.
+    """
+    metadata = json.loads((entry_dir / "metadata.json").read_text())
+    arrays = []
+    for i in range(len(metadata["variables"])):
+        values = np.load(entry_dir / f"{i}.npy", mmap_mode="r" if trusted else None, allow_pickle=False)
+        values.flags.writeable = False
+        arrays.append(values)
+    if not trusted and _content_key(metadata, arrays) != key:
+        raise ValueError(
+            f"Shared dataset {key} in {entry_dir.parent} does not match its content key. It was published by another "
+            "user, and may have been tampered with."
+        )
+    data_vars = {}
+    coords = {}
+    for variable, values in zip(metadata["variables"], arrays, strict=True):
+        target = coords if variable["is_coord"] else data_vars
+        target[variable["name"]] = xr.Variable(variable["dims"], values, attrs=variable["attrs"])
+    return xr.Dataset(data_vars, coords=coords, attrs=metadata["attrs"])
+
+
+def _publish_alias(store_dir: Path, alias: str, key: str, dir_mode: int) -> None:
+    """
+    Publish an alias of the current user for a content key, while holding the store lock.
+
+    Parameters
+    ----------
+    store_dir : Path
+        The directory of the store.
+    alias : str
+        The alias, e.g. the URL the dataset was loaded from.
+    key : str
+        The content key of the dataset.
+    dir_mode : int
+        The permissions of the directories all users of the store write to.
+
+    Raises
+    ------
+    PermissionError
+        If another user created the directory the aliases of the current user are published in.
+    """
+    entry_dir_mode, entry_file_mode = _entry_modes(dir_mode)
+    alias_path = _alias_path(store_dir, alias)
+    _make_shared_dir(alias_path.parent.parent, dir_mode)
+    alias_path.parent.mkdir(exist_ok=True)
+    if alias_path.parent.lstat().st_uid != os.getuid():
+        raise PermissionError(
+            f"{alias_path.parent} was created by another user, so aliases cannot be published in {store_dir}. Ask "
+            "them to remove it, or set DTC_SHARED_STORE_DIR to use another store."
+        )
+    os.chmod(alias_path.parent, entry_dir_mode)
+    if not alias_path.exists() or alias_path.read_text() != key:
+        # Replace the alias atomically, so other kernels never read a partially written key
+        tmp_alias_fd, tmp_alias_path = tempfile.mkstemp(prefix=f".{alias_path.name}.", dir=alias_path.parent)
+        with os.fdopen(tmp_alias_fd, "w") as tmp_alias_file:
+            tmp_alias_file.write(key)
+        os.chmod(tmp_alias_path, entry_file_mode)
+        os.replace(tmp_alias_path, alias_path)
+
+
+def publish_dataset(ds: xr.Dataset, alias: str | None = None, store_dir: str | Path | None = None) -> str:
+    """
+    Publish a dataset to the shared store, unless a dataset with the same content is already published.
+
+    Attributes are stored as JSON. Numpy values are converted to the equivalent Python values, and dates, times and
+    durations to ISO 8601 strings, so attached datasets hold these attributes in that form.
+
+    Parameters
+    ----------
+    ds : xr.Dataset
+        The dataset to publish. It is loaded into memory first if needed, e.g. output from run_selrem_module or
+        open_mass_balance_dataset.
+    alias : str | None, optional
+        Additional name to publish the dataset under, e.g. the URL it was loaded from, so other kernels can attach to it
+        without knowing its content, by default None.
+    store_dir : str | Path | None, optional
+        The directory of the store, by default DEFAULT_SHARED_STORE_DIR.
+
+    Returns
+    -------
+    str
+        The content key of the published dataset.
+
+    Raises
+    ------
+    TypeError
+        If an attribute of the dataset cannot be stored as JSON.
+    ValueError
+        If another user already published different content under the content key of the dataset.
+    PermissionError
+        If another user created the directory the aliases of the current user are published in.
+    """
+    store_dir = Path(store_dir or DEFAULT_SHARED_STORE_DIR)
+    ds = ds.load()
+    key = dataset_content_key(ds)
+    entry_dir = store_dir / key
+    with _store_lock(store_dir, exclusive=False) as dir_mode:
+        entry_dir_mode, entry_file_mode = _entry_modes(dir_mode)
+        if not entry_dir.exists():
+            # Write to a temporary directory first, so other kernels never see a partially written entry
+            tmp_dir = Path(tempfile.mkdtemp(prefix=f".{key}.", dir=store_dir))
+            try:
+                for i, variable in enumerate(ds.variables.values()):
+                    np.save(tmp_dir / f"{i}.npy", variable.values, allow_pickle=False)
+                (tmp_dir / "metadata.json").write_text(json.dumps(_dataset_metadata(ds), default=_json_default))
+                for file in tmp_dir.iterdir():
+                    os.chmod(file, entry_file_mode)
+                _make_shared_dir(tmp_dir / "refs", dir_mode)
+                # mkdtemp only gives access to its creator
+                os.chmod(tmp_dir, entry_dir_mode)
+                tmp_dir.rename(entry_dir)
+            except OSError:
+                # Another kernel published the same content in the meantime
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                if not entry_dir.exists():
+                    raise
+            except BaseException:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                raise
+        if not _is_trusted(entry_dir):
+            # Anyone can create a directory named after the key, and it cannot be replaced, so check what it holds
+            _read_entry(entry_dir, key, trusted=False)
+        if alias is not None:
+            _publish_alias(store_dir, alias, key, dir_mode)
+    return key
+
+
+def attach_dataset(key_or_alias: str, store_dir: str | Path | None = None) -> xr.Dataset:
+    """
+    Attach to a published dataset zero-copy, as a read-only dataset backed by memory-mapped files.
+
+    Datasets published by users that are not trusted are checked against their content key and copied into memory
+    instead. Each attachment should be paired with a call to release_dataset once the dataset is no longer used.
+
+    Parameters
+    ----------
+    key_or_alias : str
+        The content key or alias of the dataset.
+    store_dir : str | Path | None, optional
+        The directory of the store, by default DEFAULT_SHARED_STORE_DIR.
+
+    Returns
+    -------
+    xr.Dataset
+        The shared dataset. Its arrays are read-only.
+
+    Raises
+    ------
+    KeyError
+        If no dataset is published under key_or_alias.
+    ValueError
+        If a dataset published by a user that is not trusted does not match its content key.
+    """
+    store_dir = Path(store_dir or DEFAULT_SHARED_STORE_DIR)
+    # The reference marker is left before reading the entry, and under the store lock, so that the entry cannot be
+    # evicted while it is being attached
+    with _store_lock(store_dir, exclusive=False):
+        key = _resolve_key(store_dir, key_or_alias)
+        entry_dir = store_dir / key
+        trusted = _is_trusted(entry_dir)
+        ref_path = entry_dir / "refs" / str(os.getpid())
+        if trusted:
+            ref_path.touch()
+    if not trusted:
+        # The copy does not depend on the entry, which therefore needs no reference marker
+        return _read_entry(entry_dir, key, trusted=False)
+    try:
+        ds = _read_entry(entry_dir, key, trusted=True)
+    except BaseException:
+        if (store_dir, key) not in _ATTACHED:
+            ref_path.unlink(missing_ok=True)
+        raise
+    _ATTACHED[(store_dir, key)] = _ATTACHED.get((store_dir, key), 0) + 1
+    return ds
+
+
+def release_dataset(key_or_alias: str, store_dir: str | Path | None = None) -> None:
+    """
+    Release an attachment made with attach_dataset, allowing the entry to be evicted once no process uses it.
+
+    Parameters
+    ----------
+    key_or_alias : str
+        The content key or alias of the dataset.
+    store_dir : str | Path | None, optional
+        The directory of the store, by default DEFAULT_SHARED_STORE_DIR.
+    """
+    store_dir = Path(store_dir or DEFAULT_SHARED_STORE_DIR)
+    key = _resolve_key(store_dir, key_or_alias)
+    count = _ATTACHED.get((store_dir, key), 0) - 1
+    if count > 0:
+        _ATTACHED[(store_dir, key)] = count
+        return
+    # Copies of untrusted entries are not counted, and left no reference marker
+    if _ATTACHED.pop((store_dir, key), None) is not None:
+        (store_dir / key / "refs" / str(os.getpid())).unlink(missing_ok=True)
+
+
+def _has_live_references(entry_dir: Path) -> bool:
+    """
+    Return whether any running process holds a reference to a store entry, cleaning up references of dead processes.
+
+    As anyone can leave a reference marker, markers only count when they were left by the user running the process.
+
+    Parameters
+    ----------
+    entry_dir : Path
+        The directory of the store entry.
+
+    Returns
+    -------
+    bool
+        Whether the entry is in use.
+    """
+    in_use = False
+    for ref_path in (entry_dir / "refs").iterdir():
+        try:
+            ref_uid = ref_path.lstat().st_uid
+            process_uid = (_PROC_DIR / str(int(ref_path.name))).stat().st_uid
+        except ValueError:
+            # Not a reference marker
+            continue
+        except FileNotFoundError:
+            # References of other users cannot be removed, but do not keep the entry alive either
+            with contextlib.suppress(OSError):
+                ref_path.unlink(missing_ok=True)
+            continue
+        if ref_uid == process_uid:
+            in_use = True
+    return in_use
+
+
+def evict_shared_datasets(max_bytes: int = 0, store_dir: str | Path | None = None) -> list[str]:
+    """
+    Remove unreferenced entries from the store, least recently published first, until it fits in max_bytes.
+
+    Kernels that still have an evicted dataset attached keep working, as their memory maps remain valid until closed.
+    Entries published by other users cannot be removed and are skipped.
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        The maximum total size of the store after eviction, by default 0 (evict all unreferenced entries).
+    store_dir : str | Path | None, optional
+        The directory of the store, by default DEFAULT_SHARED_STORE_DIR.
+
+    Returns
+    -------
+    list[str]
+        The content keys of the evicted entries.
+    """
+    store_dir = Path(store_dir or DEFAULT_SHARED_STORE_DIR)
+    if not store_dir.exists():
+        return []
+    with _store_lock(store_dir, exclusive=True):
+        entries = sorted(
+            (path for path in store_dir.iterdir() if (path / "metadata.json").exists()),
+            key=lambda path: (path / "metadata.json").stat().st_mtime,
+        )
+        sizes = {path: sum(file.stat().st_size for file in path.glob("*.npy")) for path in entries}
+        total_bytes = sum(sizes.values())
+        evicted = []
+        for entry_dir in entries:
+            if total_bytes <= max_bytes:
+                break
+            if entry_dir.lstat().st_uid != os.getuid() or _has_live_references(entry_dir):
+                continue
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            if entry_dir.exists():
+                continue
+            total_bytes -= sizes[entry_dir]
+            evicted.append(entry_dir.name)
+        # Aliases of other users cannot be removed, and are ignored once the entry they point to is gone
+        aliases_dir = _alias_path(store_dir, "").parent
+        if aliases_dir.is_dir() and not aliases_dir.is_symlink():
+            for alias_path in aliases_dir.iterdir():
+                if alias_path.read_text() in evicted:
+                    with contextlib.suppress(OSError):
+                        alias_path.unlink(missing_ok=True)
+    return evicted
@@ -6,6 +6,7 @@ in the Digital Twin of the Cryosphere use case.
 
 This module provides:
 - Plotting functions for global and local sea-level response visualizations.
+- Animations of annual sea-level response maps.
 - Interfaces for use in Jupyter notebooks and interactive workflows.
 
 Dependencies: numpy, pandas, xarray, matplotlib, cartopy, scipy, numba
@@ -14,6 +15,7 @@ Authors: Tabea Rettelbach, Carsten Ludwigsen, DTU Space
 """
 
 from datetime import datetime
+from pathlib import Path
 
 import cartopy.crs as ccrs
 import cartopy.feature as cfeature
@@ -21,10 +23,10 @@ import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import xarray as xr
+from matplotlib.animation import FFMpegWriter, FuncAnimation, PillowWriter
 from matplotlib.gridspec import GridSpec
 
-MASS_BALANCE_COL_NAME = "land_ice_surface_specific_mass_balance_flux"
-MASS_BALANCE_ERROR_COL_NAME = "land_ice_surface_specific_mass_balance_flux_uncertainty"
+from dtc_is_notebook_helpers.mass_balance_variables import MASS_BALANCE_COL_NAME, MASS_BALANCE_ERROR_COL_NAME
 
 
 def compute_mean_mass_balance_over_time_window(
@@ -68,6 +70,82 @@ def compute_mean_mass_balance_over_time_window(
     )
 
 
+def _windowed_nanmean(values: np.ndarray, start_indices: np.ndarray, end_indices: np.ndarray) -> np.ndarray:
+    """
+    Compute the NaN-skipping mean over many time index windows at once, using prefix sums along the time axis.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        Values with the time dimension first, shape (n_times, ...).
+    start_indices : np.ndarray
+        Index of the first time step of each window.
+    end_indices : np.ndarray
+        Index one past the last time step of each window.
+
+    Returns
+    -------
+    np.ndarray
+        The mean of each window, shape (n_windows, ...). Windows without any valid value are NaN.
+    """
+    is_valid = ~np.isnan(values)
+    zeros = np.zeros((1, *values.shape[1:]))
+    sums = np.concatenate([zeros, np.cumsum(np.where(is_valid, values, 0), axis=0, dtype=float)])
+    counts = np.concatenate([zeros, np.cumsum(is_valid, axis=0, dtype=float)])
+    window_sums = sums[end_indices] - sums[start_indices]
+    window_counts = counts[end_indices] - counts[start_indices]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.where(window_counts > 0, window_sums / window_counts, np.nan)
+    return means.astype(values.dtype)
+
+
+def compute_mean_mass_balance_over_time_windows(
+    ds: xr.Dataset, time_windows: list[tuple[datetime, datetime]]
+) -> xr.Dataset:
+    """
+    Compute the mean mass balance and associated error over many time windows in a single pass over the time axis.
+
+    This is equivalent to calling compute_mean_mass_balance_over_time_window for each window and stacking the results,
+    with the same NaN-skipping semantics, but the data is only scanned once regardless of the number of windows.
+
+    Parameters
+    ----------
+    ds : xr.Dataset
+        Input mass balance dataset with a time dimension.
+    time_windows : list[tuple[datetime, datetime]]
+        The (start_time, end_time) of each window. As with compute_mean_mass_balance_over_time_window, both ends are
+        inclusive.
+
+    Returns
+    -------
+    xr.Dataset
+        Dataset with a 'window' dimension in addition to the spatial dimensions of
+        compute_mean_mass_balance_over_time_window, and the 'window_start' and 'window_end' of each window as
+        coordinates.
+    """
+    times = ds["time"].values
+    window_starts = np.array([start_time for start_time, _ in time_windows], dtype=times.dtype)
+    window_ends = np.array([end_time for _, end_time in time_windows], dtype=times.dtype)
+    start_indices = np.searchsorted(times, window_starts, side="left")
+    end_indices = np.searchsorted(times, window_ends, side="right")
+    return xr.Dataset(
+        {
+            var_name: (
+                ["window", "point"],
+                _windowed_nanmean(ds[var_name].transpose("time", "point").values, start_indices, end_indices),
+            )
+            for var_name in [MASS_BALANCE_COL_NAME, MASS_BALANCE_ERROR_COL_NAME]
+        },
+        coords={
+            "y": ds["y"].data,
+            "x": ds["x"].data,
+            "point": ds["point"].data,
+            "window_start": ("window", window_starts),
+            "window_end": ("window", window_ends),
+        },
+    )
+
+
 def plot_scaled_mean_mass_balance(
     mean_mb_ds: xr.Dataset, dataset_value: str, plot_description_str: str, scale: float = 1.0
 ) -> None:
@@ -293,7 +371,7 @@ def plot_slr_location_four_panels(annual_slr_ds: xr.Dataset, lat0: float, lon0:
     ----------
     annual_slr_ds : xr.Dataset
         Dataset containing annual sea-level response data from SELREM. Likely output from run_selrem_module with
-        analysis_mode="annual".
+        analysis_mode="annual", or a point-optimized copy opened with open_annual_slr_dataset(..., access="point").
     lat0 : float
         Latitude of the location to plot.
     lon0 : float
@@ -308,16 +386,6 @@ def plot_slr_location_four_panels(annual_slr_ds: xr.Dataset, lat0: float, lon0:
         raise ValueError(f"Latitude must be between -90 and 90 degrees. Got {lat0}.")
     if lon0 < -180 or lon0 > 180:
         raise ValueError(f"Longitude must be between -180 and 180 degrees. Got {lon0}.")
-    # Convert to legacy format
-    results = {
-        "ndot": [annual_slr_ds["ndot"].isel(time=i).values for i in range(len(annual_slr_ds["time"]))],
-        "udot": [annual_slr_ds["udot"].isel(time=i).values for i in range(len(annual_slr_ds["time"]))],
-        "sdot": [annual_slr_ds["sdot"].isel(time=i).values for i in range(len(annual_slr_ds["time"]))],
-        "sig_ndot": [annual_slr_ds["sig_ndot"].isel(time=i).values for i in range(len(annual_slr_ds["time"]))],
-        "sig_udot": [annual_slr_ds["sig_udot"].isel(time=i).values for i in range(len(annual_slr_ds["time"]))],
-        "sig_sdot": [annual_slr_ds["sig_sdot"].isel(time=i).values for i in range(len(annual_slr_ds["time"]))],
-    }
-
     years = pd.to_datetime(annual_slr_ds["time"].values).year
     lons_t = annual_slr_ds["x"].values
     lats_t = annual_slr_ds["y"].values
@@ -328,14 +396,15 @@ def plot_slr_location_four_panels(annual_slr_ds: xr.Dataset, lat0: float, lon0:
     dist2 = (lat2d - lat0) ** 2 + (lon2d - lon0) ** 2
     ilon, ilat = np.unravel_index(np.argmin(dist2), dist2.shape)
 
-    # Extract annual series
-    ndot_series = np.array([fld[ilon, ilat] for fld in results["ndot"]])
-    udot_series = np.array([fld[ilon, ilat] for fld in results["udot"]])
-    sdot_series = np.array([fld[ilon, ilat] for fld in results["sdot"]])
+    # Extract annual series, only reading the selected grid cell rather than whole maps
+    location_ds = annual_slr_ds[["ndot", "udot", "sdot", "sig_ndot", "sig_udot", "sig_sdot"]].isel(x=ilon, y=ilat)
+    ndot_series = location_ds["ndot"].values
+    udot_series = location_ds["udot"].values
+    sdot_series = location_ds["sdot"].values
 
-    sig_ndot_series = np.array([fld[ilon, ilat] for fld in results["sig_ndot"]])
-    sig_udot_series = np.array([fld[ilon, ilat] for fld in results["sig_udot"]])
-    sig_sdot_series = np.array([fld[ilon, ilat] for fld in results["sig_sdot"]])
+    sig_ndot_series = location_ds["sig_ndot"].values
+    sig_udot_series = location_ds["sig_udot"].values
+    sig_sdot_series = location_ds["sig_sdot"].values
 
     # Accumulate over time
     ndot_cum = np.cumsum(ndot_series)
@@ -442,3 +511,115 @@ def plot_slr_location_four_panels(annual_slr_ds: xr.Dataset, lat0: float, lon0:
     plt.suptitle(f"Sea-level response at closest cell: {lat_str}, {lon_str}", fontsize=15)
     plt.tight_layout()
     plt.show()
+
+
+def _annual_slr_frames(annual_slr_ds: xr.Dataset, variable: str, cumulative: bool) -> np.ndarray:
+    """
+    Return the yearly fields of a sea-level response variable as an array of shape (time, x, y).
+
+    Parameters
+    ----------
+    annual_slr_ds : xr.Dataset
+        Dataset containing annual sea-level response data from SELREM.
+    variable : str
+        Name of the variable to return, e.g. "sdot".
+    cumulative : bool
+        Whether to accumulate the yearly fields over time.
+
+    Returns
+    -------
+    np.ndarray
+        The yearly (or cumulative) fields.
+    """
+    frames = annual_slr_ds[variable].transpose("time", "x", "y").values
+    return np.cumsum(frames, axis=0) if cumulative else frames
+
+
+def animate_annual_slr_map(
+    annual_slr_ds: xr.Dataset,
+    output_path: str | Path,
+    variable: str = "sdot",
+    cumulative: bool = False,
+    plot_description_str: str = "Relative sea-level change",
+    fps: int = 4,
+    dpi: int = 100,
+) -> Path:
+    """
+    Write an animation of the yearly sea-level response maps to an MP4 or GIF file.
+
+    The Robinson base map, colorbar and coastlines are drawn once, and each frame only updates the mesh data and title,
+    so rendering cost per frame stays low for multi-decade, high-resolution runs.
+
+    Parameters
+    ----------
+    annual_slr_ds : xr.Dataset
+        Dataset containing annual sea-level response data from SELREM. Likely output from run_selrem_module with
+        analysis_mode="annual".
+    output_path : str | Path
+        Path of the animation file to write. The format is chosen from the suffix, ".mp4" (requires ffmpeg) or ".gif".
+    variable : str, optional
+        Name of the variable to animate, by default "sdot".
+    cumulative : bool, optional
+        Whether to animate the change accumulated since the first year instead of the yearly rate, by default False.
+    plot_description_str : str, optional
+        Description of the data being plotted, used in the title of each frame, by default "Relative sea-level change".
+    fps : int, optional
+        Frames (years) per second, by default 4.
+    dpi : int, optional
+        Resolution of the frames, by default 100.
+
+    Returns
+    -------
+    Path
+        The path of the written animation.
+
+    Raises
+    ------
+    ValueError
+        If the suffix of output_path is not ".mp4" or ".gif".
+    """
+    output_path = Path(output_path)
+    writers = {".mp4": FFMpegWriter, ".gif": PillowWriter}
+    if output_path.suffix not in writers:
+        raise ValueError(f"Animation output must be an .mp4 or .gif file. Got {output_path}.")
+    frames = _annual_slr_frames(annual_slr_ds, variable, cumulative)
+    years = pd.to_datetime(annual_slr_ds["time"].values).year
+    finite_frames = np.abs(frames[np.isfinite(frames)])
+    # Fall back to a unit color range when there is no finite or non-zero value to scale it to
+    vlim = float(finite_frames.max()) if finite_frames.size else 0.0
+    vlim = vlim or 1.0
+
+    fig = plt.figure(figsize=(10, 6))
+    try:
+        ax = fig.add_subplot(projection=ccrs.Robinson())
+        ax.set_global()
+        mesh = ax.pcolormesh(
+            annual_slr_ds["x"].values,
+            annual_slr_ds["y"].values,
+            frames[0].T,
+            cmap="Spectral_r",
+            vmin=-vlim,
+            vmax=vlim,
+            shading="auto",
+            transform=ccrs.PlateCarree(),
+        )
+        ax.add_feature(cfeature.LAND, facecolor="white", zorder=10)
+        ax.coastlines(zorder=11)
+        plt.colorbar(mesh, ax=ax, orientation="horizontal", shrink=0.7, pad=0.05, label="mm" if cumulative else "mm/yr")
+        title = ax.set_title("", fontsize=14)
+
+        def _update_frame(i: int) -> tuple:
+            """Update the mesh data and title to year i."""
+            mesh.set_array(frames[i].T)
+            if cumulative:
+                title.set_text(f"{plot_description_str} ({years[0]}-{years[i]})")
+            else:
+                title.set_text(f"{plot_description_str} ({years[i]})")
+            return mesh, title
+
+        animation = FuncAnimation(fig, _update_frame, frames=len(frames), blit=False)
+        animation.save(output_path, writer=writers[output_path.suffix](fps=fps), dpi=dpi)
+    finally:
+        # Close the figure even if saving fails, e.g. when ffmpeg is not installed
+        plt.close(fig)
+    return output_path
@@ -1,6 +1,8 @@
 """Tests for notebooks.api_helpers module."""
 
 import sys
+import threading
+import time
 from pathlib import Path
 
 sys.path.append(str(Path(__file__).resolve().parents[3]))
@@ -8,10 +10,18 @@ sys.path.append(str(Path(__file__).resolve().parents[3]))
 from unittest.mock import MagicMock, patch
 
 import pytest
+import xarray as xr
 
 from dtc_is_notebook_helpers import api_helpers
 
 
+@pytest.fixture(autouse=True)
+def clear_selrem_cache():
+    api_helpers.clear_selrem_cache()
+    yield
+    api_helpers.clear_selrem_cache()
+
+
 @pytest.fixture()
 def mock_file_content() -> bytes:
     return b"year,mass_balance\n2000,100\n2001,110\n"
@@ -158,3 +168,382 @@ def test_run_selrem_module_job_failed():
                 start_year=2000,
                 end_year=2001,
             )
+
+
+@pytest.mark.parametrize(
+    "cached_years, start_year, end_year, expected",
+    [
+        ([], 2010, 2018, [(2010, 2018)]),
+        (range(2010, 2019), 2010, 2020, [(2019, 2020)]),
+        (range(2010, 2019), 2008, 2020, [(2008, 2009), (2019, 2020)]),
+        ([2011, 2012], 2010, 2014, [(2010, 2010), (2013, 2014)]),
+        (range(2010, 2019), 2012, 2015, []),
+    ],
+)
+def test_missing_year_ranges(cached_years, start_year, end_year, expected):
+    assert api_helpers._missing_year_ranges(cached_years, start_year, end_year) == expected
+
+
+def test_run_selrem_module_annual_only_requests_missing_years(example_annual_slr_dataset: xr.Dataset):
+    outputs = {
+        "s3://bucket/1992_1994": example_annual_slr_dataset.sel(time=slice("1992", "1994")),
+        "s3://bucket/1995_1996": example_annual_slr_dataset.sel(time=slice("1995", "1996")),
+    }
+    with (
+        patch.object(api_helpers.os, "environ", {"DTC_API_PASSWORD": "fake_password"}),
+        patch.object(api_helpers.requests, "post") as mock_post,
+        patch.object(api_helpers.requests, "get") as mock_get,
+        patch.object(api_helpers.xr, "open_dataset", side_effect=lambda url, engine: outputs[url]),
+        patch.object(api_helpers.time, "sleep"),
+    ):
+        mock_post.return_value.json.return_value = {"job_id": "fake_job_id"}
+        mock_get.return_value.json.side_effect = [
+            {"status": "Succeeded", "outputs": {"main": {"output_path": "s3://bucket/1992_1994"}}},
+            {"status": "Succeeded", "outputs": {"main": {"output_path": "s3://bucket/1995_1996"}}},
+        ]
+
+        first = api_helpers.run_selrem_module("s3://bucket/vmb", 1.0, 1992, 1994, "annual")
+        assert first.sizes["time"] == 3
+
+        extended = api_helpers.run_selrem_module("s3://bucket/vmb", 1.0, 1992, 1996, "annual")
+        assert mock_post.call_count == 2
+        payload = api_helpers.json.loads(mock_post.call_args.kwargs["data"])
+        assert payload["start_time"] == "1995-01-01T00:00:00"
+        assert payload["end_time"] == "1996-12-31T00:00:00"
+        xr.testing.assert_identical(extended, example_annual_slr_dataset)
+
+        # Fully cached windows do not submit any job
+        shifted = api_helpers.run_selrem_module("s3://bucket/vmb", 1.0, 1993, 1995, "annual")
+        assert mock_post.call_count == 2
+        assert shifted.sizes["time"] == 3
+
+
+def test_run_selrem_module_annual_cache_is_per_scale():
+    with (
+        patch.object(api_helpers, "_submit_selrem_job", return_value="fake_job_id") as mock_submit,
+        patch.object(api_helpers, "_wait_for_selrem_job", return_value="s3://bucket/out"),
+        patch.object(api_helpers.xr, "open_dataset"),
+    ):
+        api_helpers.run_selrem_module("s3://bucket/vmb", 1.0, 2000, 2001, "annual")
+        api_helpers.run_selrem_module("s3://bucket/vmb", 1.05, 2000, 2001, "annual")
+        api_helpers.run_selrem_module("s3://bucket/vmb", 1.05, 2000, 2001, "annual", use_cache=False)
+        assert mock_submit.call_count == 3
+
+
+@pytest.mark.parametrize("analysis_mode", ["global", "annual"])
+def test_run_selrem_module_download(analysis_mode):
+    with (
+        patch.object(api_helpers, "_submit_selrem_job", return_value="fake_job_id"),
+        patch.object(api_helpers, "_wait_for_selrem_job", return_value="s3://bucket/out"),
+        patch.object(api_helpers, "download_dataset") as mock_download,
+        patch.object(api_helpers.xr, "open_dataset") as mock_open_dataset,
+    ):
+        result = api_helpers.run_selrem_module("s3://bucket/vmb", 1.0, 2000, 2001, analysis_mode, download=True)
+        assert result == mock_download.return_value
+        mock_download.assert_called_once_with("s3://bucket/out")
+        mock_open_dataset.assert_not_called()
+
+
+def test_cancel_selrem_job():
+    with (
+        patch.object(api_helpers.os, "environ", {"DTC_API_PASSWORD": "fake_password"}),
+        patch.object(api_helpers.requests, "post") as mock_post,
+    ):
+        api_helpers.cancel_selrem_job("fake_job_id")
+        mock_post.assert_called_once_with(
+            "https://query.dtc-ice-sheets.org/jobs/fake_job_id/cancel",
+            headers=api_helpers.get_auth_headers(),
+            timeout=10,
+        )
+        mock_post.return_value.raise_for_status.assert_called_once()
+
+
+@pytest.fixture()
+def fake_clock():
+    """Patch time.monotonic and time.sleep with a clock that only advances when sleeping."""
+    clock = {"now": 0.0, "sleeps": []}
+
+    def sleep(seconds):
+        clock["sleeps"].append(seconds)
+        clock["now"] += seconds
+
+    with (
+        patch.object(api_helpers.time, "monotonic", side_effect=lambda: clock["now"]),
+        patch.object(api_helpers.time, "sleep", side_effect=sleep),
+    ):
+        yield clock
+
+
+def test_run_selrem_module_timeout_cancels_job(fake_clock):
+    with (
+        patch.object(api_helpers, "_submit_selrem_job", return_value="fake_job_id"),
+        patch.object(api_helpers, "cancel_selrem_job") as mock_cancel,
+        patch.object(api_helpers.requests, "get") as mock_get,
+        patch.object(api_helpers.os, "environ", {"DTC_API_PASSWORD": "fake_password"}),
+    ):
+        mock_get.return_value.json.return_value = {"status": "Running"}
+        with pytest.raises(TimeoutError, match="SELREM job fake_job_id did not finish before the deadline"):
+            api_helpers.run_selrem_module("s3://bucket/vmb", 1.0, 2000, 2001, timeout=5)
+        # Sleeps and polling requests are cut short so the call ends at the deadline
+        assert fake_clock["sleeps"] == [2, 2, 1]
+        assert [call.kwargs["timeout"] for call in mock_get.call_args_list] == [3, 1]
+        mock_cancel.assert_called_once_with("fake_job_id")
+
+
+@pytest.mark.parametrize(
+    "timeout, expected_request_timeout", [(None, 600), (30, 30), (3600, api_helpers.WORKFLOW_API_TIMEOUT)]
+)
+def test_run_selrem_module_timeout_bounds_submission(fake_clock, timeout, expected_request_timeout):
+    with (
+        patch.object(api_helpers.os, "environ", {"DTC_API_PASSWORD": "fake_password"}),
+        patch.object(api_helpers.requests, "post", side_effect=api_helpers.requests.exceptions.Timeout) as mock_post,
+    ):
+        with pytest.raises(api_helpers.requests.exceptions.Timeout):
+            api_helpers.run_selrem_module("s3://bucket/vmb", 1.0, 2000, 2001, timeout=timeout)
+        # Submission keeps the workflow timeout, only shortened to end by the deadline
+        assert mock_post.call_args.kwargs["timeout"] == expected_request_timeout
+
+
+def test_run_selrem_module_annual_timeout_stops_submitting(fake_clock, example_annual_slr_dataset: xr.Dataset):
+    def fake_wait(job_id, deadline, cancel_event):
+        # The first job takes longer than the whole timeout
+        fake_clock["now"] += 60
+        return "s3://bucket/out"
+
+    with (
+        patch.object(api_helpers, "_wait_for_selrem_job", side_effect=fake_wait),
+        patch.object(api_helpers, "cancel_selrem_job") as mock_cancel,
+        patch.object(api_helpers.requests, "post") as mock_post,
+        patch.object(api_helpers.xr, "open_dataset", return_value=example_annual_slr_dataset),
+        patch.object(api_helpers.os, "environ", {"DTC_API_PASSWORD": "fake_password"}),
+    ):
+        mock_post.return_value.json.return_value = {"job_id": "fake_job_id"}
+        api_helpers.run_selrem_module("s3://bucket/vmb", 1.0, 1994, 1994, "annual")
+        # Years 1992-1993 and 1995-1996 are missing, the second range must not be submitted after the deadline
+        with pytest.raises(TimeoutError, match="Submission of SELREM job for 1995-1996"):
+            api_helpers.run_selrem_module("s3://bucket/vmb", 1.0, 1992, 1996, "annual", timeout=30)
+        assert mock_post.call_count == 2
+        mock_cancel.assert_not_called()
+
+
+def test_run_selrem_module_polling_error_cancels_job():
+    with (
+        patch.object(api_helpers, "_submit_selrem_job", return_value="fake_job_id"),
+        patch.object(api_helpers, "cancel_selrem_job") as mock_cancel,
+        patch.object(api_helpers.requests, "get") as mock_get,
+        patch.object(api_helpers.time, "sleep"),
+        patch.object(api_helpers.os, "environ", {"DTC_API_PASSWORD": "fake_password"}),
+    ):
+        mock_get.return_value.raise_for_status.side_effect = api_helpers.requests.exceptions.HTTPError
+        with pytest.raises(api_helpers.requests.exceptions.HTTPError):
+            api_helpers.run_selrem_module("s3://bucket/vmb", 1.0, 2000, 2001)
+        mock_cancel.assert_called_once_with("fake_job_id")
+
+
+def test_run_selrem_module_failed_job_is_not_cancelled():
+    with (
+        patch.object(api_helpers, "_submit_selrem_job", return_value="fake_job_id"),
+        patch.object(api_helpers, "cancel_selrem_job") as mock_cancel,
+        patch.object(api_helpers.requests, "get") as mock_get,
+        patch.object(api_helpers.time, "sleep"),
+        patch.object(api_helpers.os, "environ", {"DTC_API_PASSWORD": "fake_password"}),
+    ):
+        mock_get.return_value.json.return_value = {"status": "Failed"}
+        with pytest.raises(RuntimeError, match="SELREM job fake_job_id failed or was cancelled"):
+            api_helpers.run_selrem_module("s3://bucket/vmb", 1.0, 2000, 2001)
+        mock_cancel.assert_not_called()
+
+
+def test_run_selrem_module_interrupt_cancels_job():
+    with (
+        patch.object(api_helpers, "_submit_selrem_job", return_value="fake_job_id"),
+        patch.object(api_helpers, "cancel_selrem_job") as mock_cancel,
+        patch.object(api_helpers.time, "sleep", side_effect=KeyboardInterrupt),
+    ):
+        with pytest.raises(KeyboardInterrupt):
+            api_helpers.run_selrem_module("s3://bucket/vmb", 1.0, 2000, 2001, "annual")
+        mock_cancel.assert_called_once_with("fake_job_id")
+
+
+def test_run_selrem_module_cancel_failure_keeps_original_error():
+    with (
+        patch.object(api_helpers, "_submit_selrem_job", return_value="fake_job_id"),
+        patch.object(
+            api_helpers, "cancel_selrem_job", side_effect=api_helpers.requests.exceptions.ConnectionError
+        ) as mock_cancel,
+        patch.object(api_helpers.time, "sleep"),
+    ):
+        with pytest.raises(TimeoutError):
+            api_helpers.run_selrem_module("s3://bucket/vmb", 1.0, 2000, 2001, timeout=0)
+        mock_cancel.assert_called_once_with("fake_job_id")
+
+
+def test_prefetch_selrem_module_runs_modes_concurrently():
+    barrier = threading.Barrier(2, timeout=5)
+
+    def fake_run_selrem_module(vmb_url, scale, start_year, end_year, analysis_mode, download, timeout, cancel_event):
+        # Both runs must be in flight at the same time to get past the barrier
+        barrier.wait()
+        return f"{analysis_mode}_{vmb_url}_{scale}_{start_year}_{end_year}"
+
+    with patch.object(api_helpers, "run_selrem_module", side_effect=fake_run_selrem_module):
+        futures = api_helpers.prefetch_selrem_module("s3://bucket/vmb", 1.0, 2010, 2018)
+        assert set(futures) == {"global", "annual"}
+        assert futures["global"].result(timeout=5) == "global_s3://bucket/vmb_1.0_2010_2018"
+        assert futures["annual"].result(timeout=5) == "annual_s3://bucket/vmb_1.0_2010_2018"
+
+
+def test_prefetch_selrem_module_cancel_event_cancels_running_jobs():
+    cancel_event = threading.Event()
+    job_ids = iter(["global_job_id", "annual_job_id"])
+    polling = threading.Semaphore(0)
+
+    def fake_sleep(seconds):
+        polling.release()
+        cancel_event.wait(timeout=5)
+
+    with (
+        patch.object(api_helpers, "_submit_selrem_job", side_effect=lambda *args: next(job_ids)),
+        patch.object(api_helpers, "cancel_selrem_job") as mock_cancel,
+        patch.object(api_helpers.requests, "get") as mock_get,
+        patch.object(api_helpers.time, "sleep", side_effect=fake_sleep),
+        patch.object(api_helpers.os, "environ", {"DTC_API_PASSWORD": "fake_password"}),
+    ):
+        mock_get.return_value.json.return_value = {"status": "Running"}
+        futures = api_helpers.prefetch_selrem_module("s3://bucket/vmb", 1.0, 2010, 2018, cancel_event=cancel_event)
+        # Wait until both runs are polling their jobs, then abandon the prefetch
+        assert polling.acquire(timeout=5)
+        assert polling.acquire(timeout=5)
+        cancel_event.set()
+        for future in futures.values():
+            with pytest.raises(api_helpers.CancelledError):
+                future.result(timeout=5)
+        assert {call.args[0] for call in mock_cancel.call_args_list} == {"global_job_id", "annual_job_id"}
+
+
+def test_prefetch_selrem_module_invalid_mode():
+    with pytest.raises(ValueError, match="Unknown analysis mode: foo"):
+        api_helpers.prefetch_selrem_module("s3://bucket/vmb", 1.0, 2010, 2018, analysis_modes=("global", "foo"))
+
+
+def test_run_selrem_module_cancel_event_cancels_job():
+    cancel_event = threading.Event()
+    cancel_event.set()
+    with (
+        patch.object(api_helpers, "_submit_selrem_job", return_value="fake_job_id"),
+        patch.object(api_helpers, "cancel_selrem_job") as mock_cancel,
+        patch.object(api_helpers.requests, "get") as mock_get,
+        patch.object(api_helpers.time, "sleep"),
+    ):
+        with pytest.raises(api_helpers.CancelledError, match="SELREM job fake_job_id was cancelled by the caller"):
+            api_helpers.run_selrem_module("s3://bucket/vmb", 1.0, 2000, 2001, cancel_event=cancel_event)
+        mock_get.assert_not_called()
+        mock_cancel.assert_called_once_with("fake_job_id")
+
+
+def test_run_selrem_module_annual_cache_evicts_least_recently_used(example_annual_slr_dataset: xr.Dataset):
+    with (
+        patch.object(api_helpers, "SELREM_CACHE_MAX_ENTRIES", 2),
+        patch.object(api_helpers, "_submit_selrem_job", return_value="fake_job_id") as mock_submit,
+        patch.object(api_helpers, "_wait_for_selrem_job", return_value="s3://bucket/out"),
+        patch.object(api_helpers.xr, "open_dataset", return_value=example_annual_slr_dataset),
+    ):
+        api_helpers.run_selrem_module("s3://bucket/vmb", 1.0, 1992, 1993, "annual")
+        api_helpers.run_selrem_module("s3://bucket/vmb", 1.1, 1992, 1993, "annual")
+        # Reusing scale 1.0 makes 1.1 the least recently used entry
+        api_helpers.run_selrem_module("s3://bucket/vmb", 1.0, 1992, 1993, "annual")
+        api_helpers.run_selrem_module("s3://bucket/vmb", 1.2, 1992, 1993, "annual")
+        assert list(api_helpers._ANNUAL_SLR_CACHE) == [("s3://bucket/vmb", 1.0), ("s3://bucket/vmb", 1.2)]
+        assert mock_submit.call_count == 3
+
+
+@pytest.fixture()
+def waiting_for_in_flight_years():
+    """Patch the cache condition to signal an event whenever a run waits for years computed by another run."""
+    waiting = threading.Event()
+    condition = api_helpers._ANNUAL_SLR_CACHE_CONDITION
+    wait = condition.wait
+
+    def signal_and_wait(timeout=None):
+        waiting.set()
+        return wait(timeout)
+
+    with patch.object(condition, "wait", side_effect=signal_and_wait):
+        yield waiting
+
+
+def test_run_selrem_module_annual_concurrent_runs_share_jobs(
+    example_annual_slr_dataset: xr.Dataset, waiting_for_in_flight_years: threading.Event
+):
+    job_done = threading.Event()
+
+    def fake_wait(job_id, deadline, cancel_event):
+        assert job_done.wait(timeout=5)
+        return "s3://bucket/out"
+
+    with (
+        patch.object(api_helpers, "_submit_selrem_job", return_value="fake_job_id") as mock_submit,
+        patch.object(api_helpers, "_wait_for_selrem_job", side_effect=fake_wait),
+        patch.object(api_helpers.xr, "open_dataset", return_value=example_annual_slr_dataset),
+    ):
+        futures = api_helpers.prefetch_selrem_module("s3://bucket/vmb", 1.0, 1992, 1996, analysis_modes=("annual",))
+        # The same run from the notebook while the prefetched job is still running
+        results = []
+        runner = threading.Thread(
+            target=lambda: results.append(api_helpers.run_selrem_module("s3://bucket/vmb", 1.0, 1993, 1995, "annual"))
+        )
+        while mock_submit.call_count == 0:
+            time.sleep(0.01)
+        runner.start()
+        assert waiting_for_in_flight_years.wait(timeout=5)
+        job_done.set()
+        runner.join(timeout=5)
+        xr.testing.assert_identical(futures["annual"].result(timeout=5), example_annual_slr_dataset)
+        assert results[0].sizes["time"] == 3
+        mock_submit.assert_called_once()
+    assert api_helpers._ANNUAL_SLR_IN_FLIGHT == {}
+
+
+def test_run_selrem_module_annual_waiting_run_takes_over_failed_years(
+    example_annual_slr_dataset: xr.Dataset, waiting_for_in_flight_years: threading.Event
+):
+    first_job_failing = threading.Event()
+
+    def fake_wait(job_id, deadline, cancel_event):
+        if job_id == "failing_job_id":
+            assert first_job_failing.wait(timeout=5)
+            raise RuntimeError("SELREM job failing_job_id failed or was cancelled")
+        return "s3://bucket/out"
+
+    with (
+        patch.object(api_helpers, "_submit_selrem_job", side_effect=["failing_job_id", "fake_job_id"]) as mock_submit,
+        patch.object(api_helpers, "_wait_for_selrem_job", side_effect=fake_wait),
+        patch.object(api_helpers.xr, "open_dataset", return_value=example_annual_slr_dataset),
+    ):
+        failing = api_helpers.prefetch_selrem_module("s3://bucket/vmb", 1.0, 1992, 1996, analysis_modes=("annual",))
+        while mock_submit.call_count == 0:
+            time.sleep(0.01)
+        waiting = api_helpers.prefetch_selrem_module("s3://bucket/vmb", 1.0, 1992, 1996, analysis_modes=("annual",))
+        assert waiting_for_in_flight_years.wait(timeout=5)
+        first_job_failing.set()
+        with pytest.raises(RuntimeError, match="failing_job_id"):
+            failing["annual"].result(timeout=5)
+        xr.testing.assert_identical(waiting["annual"].result(timeout=5), example_annual_slr_dataset)
+        assert mock_submit.call_count == 2
+
+
+def test_run_selrem_module_annual_cache_is_thread_safe(example_annual_slr_dataset: xr.Dataset):
+    with (
+        patch.object(api_helpers, "SELREM_CACHE_MAX_ENTRIES", 1),
+        patch.object(api_helpers, "_submit_selrem_job", return_value="fake_job_id"),
+        patch.object(api_helpers, "_wait_for_selrem_job", return_value="s3://bucket/out"),
+        patch.object(api_helpers.xr, "open_dataset", return_value=example_annual_slr_dataset),
+    ):
+        futures = [
+            api_helpers.prefetch_selrem_module("s3://bucket/vmb", scale, 1992, 1996, analysis_modes=("annual",))
+            for scale in [1.0, 1.1, 1.2, 1.3] * 5
+        ]
+        for future in futures:
+            assert future["annual"].result(timeout=5).sizes["time"] == 5
+    assert len(api_helpers._ANNUAL_SLR_CACHE) == 1
+    assert api_helpers._ANNUAL_SLR_IN_FLIGHT == {}
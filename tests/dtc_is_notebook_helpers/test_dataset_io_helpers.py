@@ -0,0 +1,184 @@
+"""Tests for notebooks.dataset_io_helpers module."""
+
+import sys
+from datetime import datetime
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[3]))
+
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from dtc_is_notebook_helpers import dataset_io_helpers
+from dtc_is_notebook_helpers.mass_balance_variables import MASS_BALANCE_COL_NAME, MASS_BALANCE_ERROR_COL_NAME
+from dtc_is_notebook_helpers.uc2_plotting_helpers import compute_mean_mass_balance_over_time_window
+
+
+def test_write_point_optimized_copy_roundtrip(example_annual_slr_dataset: xr.Dataset, tmp_path: Path):
+    store_path = dataset_io_helpers.write_point_optimized_copy(
+        example_annual_slr_dataset, "s3://bucket/slr", tmp_path / "point.zarr", tile_size=4
+    )
+    point_ds = xr.open_dataset(store_path, engine="zarr")
+    assert point_ds.attrs.pop(dataset_io_helpers.SOURCE_SLR_URL_ATTR) == "s3://bucket/slr"
+    xr.testing.assert_identical(point_ds.load(), example_annual_slr_dataset.load())
+    for var_name in example_annual_slr_dataset.data_vars:
+        assert point_ds[var_name].encoding["chunks"] == (5, 4, 4)
+    # Only the final store is left behind
+    assert [path.name for path in tmp_path.iterdir()] == ["point.zarr"]
+
+
+def test_write_point_optimized_copy_overwrites_existing(example_annual_slr_dataset: xr.Dataset, tmp_path: Path):
+    store_path = tmp_path / "point.zarr"
+    dataset_io_helpers.write_point_optimized_copy(example_annual_slr_dataset, "s3://bucket/slr_1", store_path)
+    dataset_io_helpers.write_point_optimized_copy(example_annual_slr_dataset * 2, "s3://bucket/slr_2", store_path)
+    point_ds = xr.open_dataset(store_path, engine="zarr")
+    assert point_ds.attrs[dataset_io_helpers.SOURCE_SLR_URL_ATTR] == "s3://bucket/slr_2"
+    xr.testing.assert_allclose(point_ds, example_annual_slr_dataset * 2)
+    assert [path.name for path in tmp_path.iterdir()] == ["point.zarr"]
+
+
+def test_write_point_optimized_copy_interrupted(example_annual_slr_dataset: xr.Dataset, tmp_path: Path):
+    store_path = tmp_path / "point.zarr"
+    with (
+        patch.object(xr.Dataset, "to_zarr", side_effect=[None, KeyboardInterrupt]),
+        pytest.raises(KeyboardInterrupt),
+    ):
+        dataset_io_helpers.write_point_optimized_copy(example_annual_slr_dataset, "s3://bucket/slr", store_path)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_write_point_optimized_copy_invalid_tile_size(example_annual_slr_dataset: xr.Dataset, tmp_path: Path):
+    with pytest.raises(ValueError, match="tile_size must be positive"):
+        dataset_io_helpers.write_point_optimized_copy(
+            example_annual_slr_dataset, "s3://bucket/slr", tmp_path / "point.zarr", tile_size=0
+        )
+
+
+def test_open_annual_slr_dataset_selects_layout(example_annual_slr_dataset: xr.Dataset, tmp_path: Path):
+    point_path = tmp_path / "point.zarr"
+    with patch.object(dataset_io_helpers.xr, "open_dataset", wraps=xr.open_dataset) as mock_open_dataset:
+        # No point-optimized copy yet, so point queries fall back to the map layout
+        with pytest.raises(FileNotFoundError):
+            dataset_io_helpers.open_annual_slr_dataset(str(tmp_path / "slr.zarr"), point_path, access="point")
+        mock_open_dataset.assert_called_with(str(tmp_path / "slr.zarr"), engine="zarr")
+
+        dataset_io_helpers.write_point_optimized_copy(
+            example_annual_slr_dataset, str(tmp_path / "slr.zarr"), point_path
+        )
+        point_ds = dataset_io_helpers.open_annual_slr_dataset(str(tmp_path / "slr.zarr"), point_path, access="point")
+        mock_open_dataset.assert_called_with(point_path, engine="zarr")
+        assert point_ds.attrs[dataset_io_helpers.SOURCE_SLR_URL_ATTR] == str(tmp_path / "slr.zarr")
+
+    with patch.object(dataset_io_helpers.xr, "open_dataset") as mock_open_dataset:
+        dataset_io_helpers.open_annual_slr_dataset("s3://bucket/slr", point_path, access="map")
+        mock_open_dataset.assert_called_once_with("s3://bucket/slr", engine="zarr")
+
+
+def test_open_annual_slr_dataset_ignores_copy_of_other_run(example_annual_slr_dataset: xr.Dataset, tmp_path: Path):
+    point_path = tmp_path / "point.zarr"
+    dataset_io_helpers.write_point_optimized_copy(example_annual_slr_dataset, "s3://bucket/slr_1", point_path)
+    slr_path = tmp_path / "slr_2.zarr"
+    (example_annual_slr_dataset * 2).drop_encoding().to_zarr(slr_path)
+    with patch.object(xr.Dataset, "close", autospec=True, side_effect=xr.Dataset.close) as mock_close:
+        ds = dataset_io_helpers.open_annual_slr_dataset(str(slr_path), point_path, access="point")
+    # The point-optimized copy of the other run is closed before falling back to the map layout
+    mock_close.assert_called_once()
+    assert mock_close.call_args.args[0].attrs[dataset_io_helpers.SOURCE_SLR_URL_ATTR] == "s3://bucket/slr_1"
+    assert dataset_io_helpers.SOURCE_SLR_URL_ATTR not in ds.attrs
+    xr.testing.assert_allclose(ds, example_annual_slr_dataset * 2)
+
+
+def test_open_annual_slr_dataset_invalid_access():
+    with pytest.raises(ValueError, match="Unknown access pattern: foo"):
+        dataset_io_helpers.open_annual_slr_dataset("s3://bucket/slr", access="foo")
+
+
+@pytest.mark.parametrize(
+    "shape, chunks, chunks_per_request, expected_count",
+    [
+        ((5, 15, 15), (5, 15, 15), 1, 1),
+        ((5, 15, 15), (1, 4, 4), 1, 80),
+        ((5, 15, 15), (1, 4, 4), 2, 48),
+        ((1168,), (13579,), 1, 1),
+        ((), (), 1, 1),
+    ],
+)
+def test_chunk_regions_cover_array(shape, chunks, chunks_per_request, expected_count):
+    regions = dataset_io_helpers._chunk_regions(shape, chunks, chunks_per_request)
+    assert len(regions) == expected_count
+    covered = np.zeros(shape, dtype=int)
+    for region in regions:
+        covered[region] += 1
+    assert (covered == 1).all()
+
+
+@pytest.mark.parametrize("chunks_per_request", [1, 3])
+def test_download_dataset_matches_compute(test_inputs_dir: Path, tmp_path: Path, chunks_per_request: int):
+    source = xr.open_dataset(test_inputs_dir / "expected_annual_slr_for_jakobshavn_mb_sampled.zarr", engine="zarr")
+    url = str(
+        dataset_io_helpers.write_point_optimized_copy(source, "s3://bucket/slr", tmp_path / "point.zarr", tile_size=4)
+    )
+    progress = []
+    ds = dataset_io_helpers.download_dataset(
+        url, max_workers=4, chunks_per_request=chunks_per_request, progress_callback=lambda *args: progress.append(args)
+    )
+    xr.testing.assert_identical(ds, xr.open_dataset(url, engine="zarr").compute())
+    downloaded_mb, total_mb, mb_per_s = progress[-1]
+    assert downloaded_mb == pytest.approx(total_mb)
+    assert mb_per_s > 0
+
+
+def test_download_dataset_interrupt_drops_pending_reads(test_inputs_dir: Path, tmp_path: Path):
+    source = xr.open_dataset(test_inputs_dir / "expected_annual_slr_for_jakobshavn_mb_sampled.zarr", engine="zarr")
+    url = str(
+        dataset_io_helpers.write_point_optimized_copy(source, "s3://bucket/slr", tmp_path / "point.zarr", tile_size=4)
+    )
+
+    def interrupt(*args):
+        raise KeyboardInterrupt
+
+    with (
+        patch.object(dataset_io_helpers, "_read_region", wraps=dataset_io_helpers._read_region) as mock_read_region,
+        pytest.raises(KeyboardInterrupt),
+    ):
+        dataset_io_helpers.download_dataset(url, max_workers=1, progress_callback=interrupt)
+    # Only the reads started before the interruption were made, out of 16 tiles for each of the 7 variables
+    assert mock_read_region.call_count < 16
+
+
+def test_download_dataset_variable_subset(test_inputs_dir: Path):
+    url = str(test_inputs_dir / "jakobshavn_mass_balance.zarr")
+    ds = dataset_io_helpers.download_dataset(url, variables=["x", "y"])
+    assert set(ds.data_vars) == {"x", "y"}
+    xr.testing.assert_identical(ds, xr.open_dataset(url, engine="zarr")[["x", "y"]].compute())
+
+
+@pytest.mark.parametrize("kwargs", [{"max_workers": 0}, {"chunks_per_request": 0}])
+def test_download_dataset_invalid_arguments(kwargs):
+    with pytest.raises(ValueError, match="must be positive"):
+        dataset_io_helpers.download_dataset("s3://bucket/slr", **kwargs)
+
+
+def test_open_mass_balance_dataset_pushdown(test_inputs_dir: Path):
+    url = str(test_inputs_dir / "jakobshavn_mass_balance.zarr")
+    start_time, end_time = datetime(1993, 1, 1), datetime(1994, 12, 31)
+    ds = dataset_io_helpers.open_mass_balance_dataset(url, start_time, end_time)
+
+    assert set(ds.data_vars) == {MASS_BALANCE_COL_NAME, MASS_BALANCE_ERROR_COL_NAME, "x", "y"}
+    assert ds.sizes["time"] == 2
+    assert all(variable._in_memory for variable in ds.variables.values())
+    full_ds = xr.open_dataset(url, engine="zarr").compute()
+    xr.testing.assert_identical(
+        compute_mean_mass_balance_over_time_window(ds, start_time, end_time),
+        compute_mean_mass_balance_over_time_window(full_ds, start_time, end_time),
+    )
+
+
+def test_open_mass_balance_dataset_variables_without_window(test_inputs_dir: Path):
+    url = str(test_inputs_dir / "jakobshavn_mass_balance.zarr")
+    ds = dataset_io_helpers.open_mass_balance_dataset(url, variables=[MASS_BALANCE_COL_NAME, "x"])
+    assert set(ds.data_vars) == {MASS_BALANCE_COL_NAME, "x", "y"}
+    assert ds.sizes["time"] == 5
@@ -0,0 +1,163 @@
+"""Tests for notebooks.fingerprint_helpers module."""
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[3]))
+
+from concurrent.futures import Future
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from dtc_is_notebook_helpers import fingerprint_helpers
+
+
+@pytest.fixture
+def region_responses(example_global_slr_dataset: xr.Dataset) -> dict[str, xr.Dataset]:
+    gris = example_global_slr_dataset.load()
+    # A second, differently shaped response to check the regions are not mixed up
+    ais = gris.copy(data={name: np.flip(gris[name].values, axis=1) * 3 for name in gris.data_vars})
+    ais.attrs = {name: value * 3 for name, value in gris.attrs.items()}
+    return {"GrIS": gris, "AIS": ais}
+
+
+@pytest.fixture
+def unit_response_basis(region_responses: dict[str, xr.Dataset]) -> xr.Dataset:
+    return fingerprint_helpers.build_unit_response_basis(region_responses, {"GrIS": 2.0, "AIS": -4.0})
+
+
+def test_build_unit_response_basis(region_responses: dict[str, xr.Dataset], unit_response_basis: xr.Dataset):
+    assert list(unit_response_basis["region"].values) == ["GrIS", "AIS"]
+    assert set(unit_response_basis.data_vars) == {"sdot", "ndot", "udot", "gmsl_sdot", "gmsl_ndot", "gmsl_udot"}
+    np.testing.assert_allclose(
+        unit_response_basis["sdot"].sel(region="AIS").values, region_responses["AIS"]["sdot"].values / -4.0
+    )
+    assert unit_response_basis["gmsl_sdot"].sel(region="GrIS") == pytest.approx(
+        region_responses["GrIS"].attrs["gmsl_sdot"] / 2.0
+    )
+
+
+def test_build_unit_response_basis_invalid_inputs(region_responses: dict[str, xr.Dataset]):
+    with pytest.raises(ValueError, match="must have the same regions"):
+        fingerprint_helpers.build_unit_response_basis(region_responses, {"GrIS": 1.0})
+    with pytest.raises(ValueError, match="Mass balance of region AIS must be non-zero"):
+        fingerprint_helpers.build_unit_response_basis(region_responses, {"GrIS": 1.0, "AIS": 0.0})
+
+
+def test_superpose_unit_responses_reproduces_region_responses(
+    region_responses: dict[str, xr.Dataset], unit_response_basis: xr.Dataset
+):
+    weights = xr.DataArray([2.0, 0.0], dims=["region"], coords={"region": ["GrIS", "AIS"]})
+    response = fingerprint_helpers.superpose_unit_responses(unit_response_basis, weights)
+    for name in fingerprint_helpers.LINEAR_RESPONSE_VARIABLES:
+        assert response[name].dims == ("x", "y")
+        np.testing.assert_allclose(response[name].values, region_responses["GrIS"][name].values)
+    assert float(response["gmsl_sdot"]) == pytest.approx(region_responses["GrIS"].attrs["gmsl_sdot"])
+
+
+def test_superpose_unit_responses_with_extra_dimensions(
+    region_responses: dict[str, xr.Dataset], unit_response_basis: xr.Dataset
+):
+    weights = xr.DataArray(
+        [[-4.0, 1.0], [-4.0, 4.0]],
+        dims=["time", "region"],
+        coords={"time": [2000, 2001], "region": ["AIS", "GrIS"]},
+    )
+    response = fingerprint_helpers.superpose_unit_responses(unit_response_basis, weights)
+    assert response["sdot"].dims == ("time", "x", "y")
+    expected = region_responses["AIS"]["sdot"] + 2 * region_responses["GrIS"]["sdot"]
+    np.testing.assert_allclose(response["sdot"].sel(time=2001).values, expected.values)
+
+
+def test_superpose_unit_responses_invalid_weights(unit_response_basis: xr.Dataset):
+    with pytest.raises(ValueError, match="weights must have a 'region' dimension and coordinate"):
+        fingerprint_helpers.superpose_unit_responses(unit_response_basis, xr.DataArray([1.0, 2.0], dims=["foo"]))
+    with pytest.raises(ValueError, match=r"weights refer to regions missing from the basis: \['foo'\]"):
+        fingerprint_helpers.superpose_unit_responses(
+            unit_response_basis, xr.DataArray([1.0], dims=["region"], coords={"region": ["foo"]})
+        )
+
+
+@pytest.fixture
+def fake_prefetch_selrem_module(region_responses: dict[str, xr.Dataset]):
+    def fake_prefetch_selrem_module(vmb_url, scale, start_year, end_year, analysis_modes, cancel_event):
+        future = Future()
+        future.set_result(region_responses[vmb_url.split("/")[-1]])
+        return {"global": future}
+
+    with patch.object(
+        fingerprint_helpers, "prefetch_selrem_module", side_effect=fake_prefetch_selrem_module
+    ) as mock_prefetch:
+        yield mock_prefetch
+
+
+def test_compute_unit_response_basis_caches(fake_prefetch_selrem_module, tmp_path: Path):
+    basis_path = tmp_path / "basis.zarr"
+    urls = {"GrIS": "s3://bucket/GrIS", "AIS": "s3://bucket/AIS"}
+    masses = {"GrIS": 2.0, "AIS": -4.0}
+    computed = fingerprint_helpers.compute_unit_response_basis(urls, masses, 2010, 2018, basis_path)
+    assert fake_prefetch_selrem_module.call_count == 2
+    cached = fingerprint_helpers.compute_unit_response_basis(urls, masses, 2010, 2018, basis_path)
+    assert fake_prefetch_selrem_module.call_count == 2
+    xr.testing.assert_allclose(cached, computed)
+    assert cached.attrs["selrem_inputs"] == computed.attrs["selrem_inputs"]
+    # Only the final store is left behind
+    assert [path.name for path in tmp_path.iterdir()] == ["basis.zarr"]
+
+
+@pytest.mark.parametrize(
+    "urls, masses, start_year, end_year",
+    [
+        ({"GrIS": "s3://bucket/GrIS", "AIS": "s3://bucket/AIS"}, {"GrIS": 2.0, "AIS": -4.0}, 1992, 2019),
+        ({"GrIS": "s3://bucket/GrIS", "AIS": "s3://bucket/AIS"}, {"GrIS": 1.0, "AIS": -4.0}, 2010, 2018),
+        ({"GrIS": "s3://bucket/AIS", "AIS": "s3://bucket/GrIS"}, {"GrIS": 2.0, "AIS": -4.0}, 2010, 2018),
+        ({"GrIS": "s3://bucket/GrIS"}, {"GrIS": 2.0}, 2010, 2018),
+    ],
+)
+def test_compute_unit_response_basis_recomputes_for_other_inputs(
+    fake_prefetch_selrem_module, tmp_path: Path, urls, masses, start_year, end_year
+):
+    basis_path = tmp_path / "basis.zarr"
+    fingerprint_helpers.compute_unit_response_basis(
+        {"GrIS": "s3://bucket/GrIS", "AIS": "s3://bucket/AIS"}, {"GrIS": 2.0, "AIS": -4.0}, 2010, 2018, basis_path
+    )
+    fake_prefetch_selrem_module.reset_mock()
+    recomputed = fingerprint_helpers.compute_unit_response_basis(urls, masses, start_year, end_year, basis_path)
+    assert fake_prefetch_selrem_module.call_count == len(urls)
+    assert list(recomputed["region"].values) == list(urls)
+    loaded = xr.open_dataset(basis_path, engine="zarr")
+    assert loaded.attrs["selrem_inputs"]["start_year"] == start_year
+    assert loaded.sizes["region"] == len(urls)
+
+
+def test_compute_unit_response_basis_invalid_regions(tmp_path: Path):
+    with pytest.raises(ValueError, match="must have the same regions"):
+        fingerprint_helpers.compute_unit_response_basis(
+            {"GrIS": "s3://bucket/GrIS"}, {"AIS": -4.0}, 2010, 2018, tmp_path / "basis.zarr"
+        )
+
+
+def test_compute_unit_response_basis_failure_cancels_other_regions(tmp_path: Path):
+    cancel_events = []
+
+    def fake_prefetch_selrem_module(vmb_url, scale, start_year, end_year, analysis_modes, cancel_event):
+        cancel_events.append(cancel_event)
+        future = Future()
+        if vmb_url.endswith("GrIS"):
+            future.set_exception(RuntimeError("SELREM job failed"))
+        return {"global": future}
+
+    urls = {"GrIS": "s3://bucket/GrIS", "AIS": "s3://bucket/AIS"}
+    with (
+        patch.object(fingerprint_helpers, "prefetch_selrem_module", side_effect=fake_prefetch_selrem_module),
+        pytest.raises(RuntimeError, match="SELREM job failed"),
+    ):
+        fingerprint_helpers.compute_unit_response_basis(
+            urls, {"GrIS": 2.0, "AIS": -4.0}, 2010, 2018, tmp_path / "basis.zarr"
+        )
+    assert len(cancel_events) == 2
+    assert all(cancel_event.is_set() for cancel_event in cancel_events)
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,163 @@
+"""Tests for notebooks.mass_balance_region_helpers module."""
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[3]))
+
+import numpy as np
+import pytest
+import xarray as xr
+from matplotlib.path import Path as MplPath
+
+from dtc_is_notebook_helpers import mass_balance_region_helpers
+from dtc_is_notebook_helpers.mass_balance_variables import MASS_BALANCE_COL_NAME, MASS_BALANCE_ERROR_COL_NAME
+
+
+def test_build_latitude_band_index():
+    lat = np.array([-90.0, -45.0, 0.0, 45.0, 90.0, np.nan])
+    region_index, names = mass_balance_region_helpers.build_latitude_band_index(lat, [-90, 0, 90])
+    np.testing.assert_array_equal(region_index, [0, 0, 1, 1, 1, mass_balance_region_helpers.NO_REGION])
+    assert names == ["-90 to 0", "0 to 90"]
+
+
+def test_build_latitude_band_index_outside_bands():
+    region_index, _ = mass_balance_region_helpers.build_latitude_band_index(np.array([50.0, 65.0, 85.0]), [60, 80])
+    np.testing.assert_array_equal(region_index, [-1, 0, -1])
+
+
+@pytest.mark.parametrize("band_edges", [[0], [0, 0], [10, 0]])
+def test_build_latitude_band_index_invalid_edges(band_edges):
+    with pytest.raises(ValueError, match="band_edges must contain at least two strictly increasing values"):
+        mass_balance_region_helpers.build_latitude_band_index(np.array([0.0]), band_edges)
+
+
+def test_build_polygon_region_index():
+    lon = np.array([0.5, 1.5, 0.5, 5.0])
+    lat = np.array([0.5, 0.5, 1.5, 5.0])
+    polygons = {
+        "left": np.array([[0, 0], [1, 0], [1, 2], [0, 2]]),
+        "square": np.array([[0, 0], [2, 0], [2, 2], [0, 2]]),
+    }
+    region_index, names = mass_balance_region_helpers.build_polygon_region_index(lon, lat, polygons)
+    # Overlapping points are assigned to the first polygon
+    np.testing.assert_array_equal(region_index, [0, 1, 0, mass_balance_region_helpers.NO_REGION])
+    assert names == ["left", "square"]
+
+
+def test_aggregate_mass_balance_by_region_matches_loop(example_mass_balance_dataset: xr.Dataset):
+    ds = example_mass_balance_dataset.load()
+    lat = ds["y"].values
+    region_index, names = mass_balance_region_helpers.build_latitude_band_index(lat, [60, 69, 70, 90])
+    result = mass_balance_region_helpers.aggregate_mass_balance_by_region(ds, region_index, names)
+
+    assert result[MASS_BALANCE_COL_NAME].dims == ("region", "time")
+    assert list(result["region"].values) == names
+    np.testing.assert_array_equal(result["time"].values, ds["time"].values)
+    for i, name in enumerate(names):
+        region_ds = ds.isel(point=region_index == i)
+        for var_name in [MASS_BALANCE_COL_NAME, MASS_BALANCE_ERROR_COL_NAME]:
+            expected = region_ds[var_name].sum(dim="point", skipna=True).values / 1e12
+            np.testing.assert_allclose(result[var_name].sel(region=name).values, expected, rtol=1e-5)
+
+
+def test_aggregate_mass_balance_by_region_without_time(example_mass_balance_dataset: xr.Dataset):
+    ds = example_mass_balance_dataset.isel(time=0).load()
+    region_index = np.zeros(ds.sizes["point"], dtype=int)
+    result = mass_balance_region_helpers.aggregate_mass_balance_by_region(ds, region_index, ["all"])
+    assert result[MASS_BALANCE_COL_NAME].dims == ("region",)
+    np.testing.assert_allclose(
+        result[MASS_BALANCE_COL_NAME].values, [ds[MASS_BALANCE_COL_NAME].sum().values / 1e12], rtol=1e-5
+    )
+
+
+def test_aggregate_mass_balance_by_region_invalid_index(example_mass_balance_dataset: xr.Dataset):
+    with pytest.raises(ValueError, match="region_index must have one entry per point"):
+        mass_balance_region_helpers.aggregate_mass_balance_by_region(
+            example_mass_balance_dataset, np.zeros(3, dtype=int), ["all"]
+        )
+
+
+@pytest.fixture
+def example_spatial_index(example_mass_balance_dataset: xr.Dataset) -> xr.Dataset:
+    return mass_balance_region_helpers.build_spatial_index(example_mass_balance_dataset, tile_size=0.5)
+
+
+@pytest.mark.parametrize(
+    "bbox",
+    [
+        (-50.0, -48.0, 68.5, 69.5),
+        (-180.0, 180.0, -90.0, 90.0),
+        (-49.3, -49.3, 69.0, 69.0),
+        (0.0, 10.0, 0.0, 10.0),
+    ],
+)
+def test_query_bbox_point_indices_matches_scan(
+    example_mass_balance_dataset: xr.Dataset, example_spatial_index: xr.Dataset, bbox
+):
+    lon_min, lon_max, lat_min, lat_max = bbox
+    lon = example_mass_balance_dataset["x"].values
+    lat = example_mass_balance_dataset["y"].values
+    expected = np.flatnonzero((lon >= lon_min) & (lon <= lon_max) & (lat >= lat_min) & (lat <= lat_max))
+    result = mass_balance_region_helpers.query_bbox_point_indices(example_spatial_index, *bbox)
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_query_bbox_point_indices_invalid_bbox(example_spatial_index: xr.Dataset):
+    with pytest.raises(ValueError, match="Invalid bounding box"):
+        mass_balance_region_helpers.query_bbox_point_indices(example_spatial_index, 10.0, 0.0, 0.0, 10.0)
+
+
+def test_subset_by_polygon_matches_scan(example_mass_balance_dataset: xr.Dataset, example_spatial_index: xr.Dataset):
+    vertices = np.array([[-50.5, 68.2], [-47.5, 68.8], [-48.5, 69.8]])
+    lon = example_mass_balance_dataset["x"].values
+    lat = example_mass_balance_dataset["y"].values
+    expected = np.flatnonzero(MplPath(vertices).contains_points(np.column_stack([lon, lat])))
+    assert 0 < len(expected) < len(lon)
+
+    subset = mass_balance_region_helpers.subset_by_polygon(
+        example_mass_balance_dataset, example_spatial_index, vertices
+    )
+    xr.testing.assert_identical(subset, example_mass_balance_dataset.isel(point=expected))
+
+
+def test_subset_by_bbox_is_lazy(example_mass_balance_dataset: xr.Dataset, example_spatial_index: xr.Dataset):
+    subset = mass_balance_region_helpers.subset_by_bbox(
+        example_mass_balance_dataset, example_spatial_index, -50.0, -48.0, 68.5, 69.5
+    )
+    assert not subset[MASS_BALANCE_COL_NAME].variable._in_memory
+    assert subset.sizes["point"] > 0
+
+
+def test_load_or_build_spatial_index_persists(example_mass_balance_dataset: xr.Dataset, tmp_path: Path):
+    index_path = tmp_path / "jakobshavn_mass_balance.spatial_index.zarr"
+    built = mass_balance_region_helpers.load_or_build_spatial_index(example_mass_balance_dataset, index_path, 0.5)
+    assert index_path.exists()
+    loaded = mass_balance_region_helpers.load_or_build_spatial_index(example_mass_balance_dataset, index_path, 0.5)
+    xr.testing.assert_equal(loaded, built)
+    assert loaded.attrs["tile_size"] == 0.5
+
+
+def test_load_or_build_spatial_index_rebuilds_for_other_points(
+    example_mass_balance_dataset: xr.Dataset, tmp_path: Path
+):
+    index_path = tmp_path / "spatial_index.zarr"
+    mass_balance_region_helpers.load_or_build_spatial_index(example_mass_balance_dataset, index_path, 0.5)
+
+    # Same number of points at other locations, e.g. a newer version of the dataset
+    moved_ds = example_mass_balance_dataset.copy()
+    moved_ds["x"] = moved_ds["x"].copy(data=moved_ds["x"].values[::-1])
+    moved_index = mass_balance_region_helpers.load_or_build_spatial_index(moved_ds, index_path, 0.5)
+    xr.testing.assert_identical(moved_index, mass_balance_region_helpers.build_spatial_index(moved_ds, 0.5))
+
+    # Fewer points, e.g. another dataset
+    subset_ds = example_mass_balance_dataset.isel(point=slice(0, 10))
+    subset_index = mass_balance_region_helpers.load_or_build_spatial_index(subset_ds, index_path, 0.5)
+    assert subset_index.attrs["n_points"] == 10
+    loaded = mass_balance_region_helpers.load_or_build_spatial_index(subset_ds, index_path, 0.5)
+    xr.testing.assert_identical(loaded, subset_index)
+
+
+def test_build_spatial_index_invalid_tile_size(example_mass_balance_dataset: xr.Dataset):
+    with pytest.raises(ValueError, match="tile_size must be positive"):
+        mass_balance_region_helpers.build_spatial_index(example_mass_balance_dataset, tile_size=0)
@@ -0,0 +1,108 @@
+"""Tests for notebooks.selrem_scheduler module."""
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[3]))
+
+import threading
+from concurrent.futures import CancelledError
+from unittest.mock import MagicMock, patch
+
+from dtc_is_notebook_helpers import selrem_scheduler
+
+
+def make_scheduler(**kwargs) -> tuple[selrem_scheduler.SelremRequestScheduler, list, threading.Event]:
+    results = []
+    done = threading.Event()
+
+    def on_result(scale, ds):
+        results.append((scale, ds))
+        done.set()
+
+    def on_error(scale, error):
+        results.append((scale, error))
+        done.set()
+
+    scheduler = selrem_scheduler.SelremRequestScheduler(
+        "s3://bucket/vmb", 2010, 2018, on_result=on_result, on_error=on_error, debounce_seconds=0.05, **kwargs
+    )
+    return scheduler, results, done
+
+
+def test_scheduler_coalesces_rapid_changes():
+    scheduler, results, done = make_scheduler()
+    mock_ds = MagicMock()
+    with patch.object(selrem_scheduler, "run_selrem_module", return_value=mock_ds) as mock_run:
+        for scale in [1.01, 1.02, 1.03, 1.04, 1.05]:
+            scheduler.submit(scale)
+        assert scheduler.status == "debouncing"
+        assert scheduler.pending_scale == 1.05
+        assert done.wait(timeout=5)
+        mock_run.assert_called_once()
+        assert mock_run.call_args.args == ("s3://bucket/vmb", 1.05, 2010, 2018, "annual")
+    assert results == [(1.05, mock_ds)]
+    assert scheduler.status == "idle"
+
+
+def test_scheduler_cancels_stale_running_job():
+    scheduler, results, done = make_scheduler()
+    first_started = threading.Event()
+
+    def fake_run_selrem_module(vmb_url, scale, start_year, end_year, analysis_mode, cancel_event):
+        if scale == 1.0:
+            first_started.set()
+            assert cancel_event.wait(timeout=5)
+            raise CancelledError
+        return f"ds_{scale}"
+
+    with patch.object(selrem_scheduler, "run_selrem_module", side_effect=fake_run_selrem_module) as mock_run:
+        scheduler.submit(1.0)
+        assert first_started.wait(timeout=5)
+        assert scheduler.status == "running"
+        assert scheduler.running_scale == 1.0
+        scheduler.submit(1.1)
+        assert done.wait(timeout=5)
+        assert mock_run.call_count == 2
+    assert results == [(1.1, "ds_1.1")]
+
+
+def test_scheduler_ignores_result_of_superseded_job():
+    scheduler, results, done = make_scheduler()
+    release_first = threading.Event()
+    first_started = threading.Event()
+
+    def fake_run_selrem_module(vmb_url, scale, start_year, end_year, analysis_mode, cancel_event):
+        if scale == 1.0:
+            first_started.set()
+            # Finishes regardless of cancellation, e.g. because the job completed just before it was cancelled
+            release_first.wait(timeout=5)
+        return f"ds_{scale}"
+
+    with patch.object(selrem_scheduler, "run_selrem_module", side_effect=fake_run_selrem_module):
+        scheduler.submit(1.0)
+        assert first_started.wait(timeout=5)
+        scheduler.submit(1.1)
+        release_first.set()
+        assert done.wait(timeout=5)
+    assert results == [(1.1, "ds_1.1")]
+
+
+def test_scheduler_reports_errors():
+    scheduler, results, done = make_scheduler()
+    error = RuntimeError("SELREM job fake_job_id failed or was cancelled")
+    with patch.object(selrem_scheduler, "run_selrem_module", side_effect=error):
+        scheduler.submit(1.0)
+        assert done.wait(timeout=5)
+    assert results == [(1.0, error)]
+
+
+def test_scheduler_cancel_drops_pending_request():
+    scheduler, results, done = make_scheduler()
+    with patch.object(selrem_scheduler, "run_selrem_module") as mock_run:
+        scheduler.submit(1.0)
+        scheduler.cancel()
+        assert scheduler.status == "idle"
+        assert not done.wait(timeout=0.2)
+        mock_run.assert_not_called()
+    assert results == []
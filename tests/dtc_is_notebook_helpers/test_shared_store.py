@@ -0,0 +1,221 @@
+"""Tests for notebooks.shared_store module."""
+
+import os
+import stat
+import sys
+import threading
+from datetime import datetime
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[3]))
+
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from dtc_is_notebook_helpers import shared_store
+
+
+@pytest.fixture(autouse=True)
+def clear_attachments():
+    shared_store._ATTACHED.clear()
+    yield
+    shared_store._ATTACHED.clear()
+
+
+@pytest.mark.parametrize("dataset_fixture", ["example_annual_slr_dataset", "example_global_slr_dataset"])
+def test_publish_and_attach_roundtrip(dataset_fixture: str, tmp_path: Path, request: pytest.FixtureRequest):
+    ds = request.getfixturevalue(dataset_fixture).load()
+    key = shared_store.publish_dataset(ds, store_dir=tmp_path)
+    shared_ds = shared_store.attach_dataset(key, store_dir=tmp_path)
+    xr.testing.assert_identical(shared_ds, ds)
+    assert isinstance(shared_ds["sdot"].variable._data, np.memmap)
+    assert not shared_ds["sdot"].values.flags.writeable
+
+
+def test_publish_dataset_deduplicates_by_content(example_global_slr_dataset: xr.Dataset, tmp_path: Path):
+    key = shared_store.publish_dataset(example_global_slr_dataset, store_dir=tmp_path)
+    assert shared_store.publish_dataset(example_global_slr_dataset.copy(deep=True), store_dir=tmp_path) == key
+    other_key = shared_store.publish_dataset(example_global_slr_dataset * 2, store_dir=tmp_path)
+    assert other_key != key
+    assert sorted(path.name for path in tmp_path.iterdir() if not path.name.startswith(".")) == sorted([key, other_key])
+
+
+def test_attach_dataset_by_alias(example_global_slr_dataset: xr.Dataset, tmp_path: Path):
+    key = shared_store.publish_dataset(example_global_slr_dataset, alias="s3://bucket/slr", store_dir=tmp_path)
+    shared_ds = shared_store.attach_dataset("s3://bucket/slr", store_dir=tmp_path)
+    xr.testing.assert_identical(shared_ds, example_global_slr_dataset.load())
+    shared_store.release_dataset("s3://bucket/slr", store_dir=tmp_path)
+    assert shared_store.evict_shared_datasets(store_dir=tmp_path) == [key]
+    with pytest.raises(KeyError, match="No shared dataset published as s3://bucket/slr"):
+        shared_store.attach_dataset("s3://bucket/slr", store_dir=tmp_path)
+
+
+def test_attach_dataset_unknown_key(tmp_path: Path):
+    with pytest.raises(KeyError, match="No shared dataset published as foo"):
+        shared_store.attach_dataset("foo", store_dir=tmp_path)
+
+
+def test_evict_shared_datasets_respects_references(example_global_slr_dataset: xr.Dataset, tmp_path: Path):
+    key = shared_store.publish_dataset(example_global_slr_dataset, store_dir=tmp_path)
+    shared_store.attach_dataset(key, store_dir=tmp_path)
+    shared_store.attach_dataset(key, store_dir=tmp_path)
+    assert shared_store.evict_shared_datasets(store_dir=tmp_path) == []
+
+    shared_store.release_dataset(key, store_dir=tmp_path)
+    assert shared_store.evict_shared_datasets(store_dir=tmp_path) == []
+
+    shared_store.release_dataset(key, store_dir=tmp_path)
+    # References left behind by processes that no longer exist do not keep the entry alive
+    (tmp_path / key / "refs" / "999999999").touch()
+    assert shared_store.evict_shared_datasets(store_dir=tmp_path) == [key]
+    assert not (tmp_path / key).exists()
+
+
+def test_evict_shared_datasets_max_bytes(example_global_slr_dataset: xr.Dataset, tmp_path: Path):
+    old_key = shared_store.publish_dataset(example_global_slr_dataset, store_dir=tmp_path)
+    new_key = shared_store.publish_dataset(example_global_slr_dataset * 2, store_dir=tmp_path)
+    entry_bytes = sum(file.stat().st_size for file in (tmp_path / new_key).glob("*.npy"))
+    assert shared_store.evict_shared_datasets(max_bytes=entry_bytes, store_dir=tmp_path) == [old_key]
+    assert (tmp_path / new_key).exists()
+    assert shared_store.evict_shared_datasets(store_dir=tmp_path / "missing") == []
+
+
+def _mode(path: Path) -> int:
+    return stat.S_IMODE(path.stat().st_mode)
+
+
+def test_publish_dataset_permissions(example_global_slr_dataset: xr.Dataset, tmp_path: Path):
+    store_dir = tmp_path / "store"
+    with patch.object(shared_store, "_NODE_SHARED_STORE_DIR", store_dir):
+        key = shared_store.publish_dataset(example_global_slr_dataset, alias="s3://bucket/slr", store_dir=store_dir)
+        shared_store.attach_dataset(key, store_dir=store_dir)
+
+    # Directories all kernels on the node write to are shared like /tmp, entries are readable by all kernels
+    for shared_dir in [store_dir, store_dir / "aliases", store_dir / key / "refs"]:
+        assert _mode(shared_dir) == 0o1777
+    assert _mode(store_dir / key) == 0o755
+    for file in (store_dir / key).glob("*.*"):
+        assert _mode(file) == 0o644
+    assert _mode(shared_store._alias_path(store_dir, "s3://bucket/slr")) == 0o644
+
+
+def test_publish_dataset_keeps_permissions_of_custom_store(example_global_slr_dataset: xr.Dataset, tmp_path: Path):
+    store_dir = tmp_path / "store"
+    store_dir.mkdir(mode=0o700)
+    key = shared_store.publish_dataset(example_global_slr_dataset, alias="s3://bucket/slr", store_dir=store_dir)
+    shared_store.attach_dataset(key, store_dir=store_dir)
+
+    # A private store stays private, and everything in it is only accessible to its owner
+    for private_dir in [store_dir, store_dir / "aliases", store_dir / key, store_dir / key / "refs"]:
+        assert _mode(private_dir) == 0o700
+    for file in (store_dir / key).glob("*.*"):
+        assert _mode(file) == 0o600
+    assert _mode(shared_store._alias_path(store_dir, "s3://bucket/slr")) == 0o600
+
+
+def test_evict_shared_datasets_waits_for_attach(example_global_slr_dataset: xr.Dataset, tmp_path: Path):
+    key = shared_store.publish_dataset(example_global_slr_dataset, store_dir=tmp_path)
+    resolve_key = shared_store._resolve_key
+    evictors = []
+    evicted = []
+
+    def resolve_key_then_evict(store_dir, key_or_alias):
+        key = resolve_key(store_dir, key_or_alias)
+        # Another kernel evicts the store after the entry was found but before it is referenced
+        evictor = threading.Thread(
+            target=lambda: evicted.extend(shared_store.evict_shared_datasets(store_dir=store_dir))
+        )
+        evictor.start()
+        evictor.join(timeout=0.5)
+        assert evictor.is_alive()
+        evictors.append(evictor)
+        return key
+
+    with patch.object(shared_store, "_resolve_key", side_effect=resolve_key_then_evict):
+        shared_ds = shared_store.attach_dataset(key, store_dir=tmp_path)
+    evictors[0].join(timeout=5)
+    assert evicted == []
+    xr.testing.assert_identical(shared_ds, example_global_slr_dataset.load())
+
+
+def test_publish_dataset_attrs_roundtrip_as_json(example_global_slr_dataset: xr.Dataset, tmp_path: Path):
+    ds = example_global_slr_dataset.assign_attrs(
+        created=np.datetime64("2024-05-01T12:00"),
+        period=np.array(["1992-01-01", "2019-12-31"], dtype="datetime64[D]"),
+        step=np.timedelta64(1, "D"),
+        processed=datetime(2024, 5, 2, 8, 30),
+        scale=np.float32(1.5),
+    )
+    key = shared_store.publish_dataset(ds, store_dir=tmp_path)
+    attrs = shared_store.attach_dataset(key, store_dir=tmp_path).attrs
+    assert attrs["created"] == "2024-05-01T12:00"
+    assert attrs["period"] == ["1992-01-01", "2019-12-31"]
+    assert attrs["step"] == "1 days"
+    assert attrs["processed"] == "2024-05-02T08:30:00"
+    assert attrs["scale"] == 1.5
+
+
+def test_publish_dataset_unsupported_attrs(example_global_slr_dataset: xr.Dataset, tmp_path: Path):
+    with pytest.raises(TypeError, match="Attribute value of type object cannot be stored in the shared store"):
+        shared_store.publish_dataset(example_global_slr_dataset.assign_attrs(foo=object()), store_dir=tmp_path)
+
+
+def test_attach_dataset_copies_untrusted_entry(example_global_slr_dataset: xr.Dataset, tmp_path: Path):
+    ds = example_global_slr_dataset.assign_attrs(created=np.datetime64("2024-05-01T12:00"), scale=np.float32(1.5))
+    key = shared_store.publish_dataset(ds, store_dir=tmp_path)
+    # Entries were published by another user
+    with patch.object(shared_store, "_is_trusted", side_effect=lambda path: path.parent != tmp_path):
+        shared_ds = shared_store.attach_dataset(key, store_dir=tmp_path)
+        shared_store.release_dataset(key, store_dir=tmp_path)
+    xr.testing.assert_equal(shared_ds, ds.load())
+    assert not isinstance(shared_ds["sdot"].variable._data, np.memmap)
+    assert not shared_ds["sdot"].values.flags.writeable
+    assert not any((tmp_path / key / "refs").iterdir())
+
+
+def test_untrusted_entry_is_checked_against_its_key(example_global_slr_dataset: xr.Dataset, tmp_path: Path):
+    key = shared_store.publish_dataset(example_global_slr_dataset, store_dir=tmp_path)
+    # Another user planted different data under the key
+    np.save(tmp_path / key / "0.npy", np.zeros_like(np.load(tmp_path / key / "0.npy")))
+    # Entries were published by another user
+    with patch.object(shared_store, "_is_trusted", side_effect=lambda path: path.parent != tmp_path):
+        with pytest.raises(ValueError, match=f"Shared dataset {key} .* does not match its content key"):
+            shared_store.attach_dataset(key, store_dir=tmp_path)
+        with pytest.raises(ValueError, match=f"Shared dataset {key} .* does not match its content key"):
+            shared_store.publish_dataset(example_global_slr_dataset, store_dir=tmp_path)
+
+
+def test_resolve_key_only_follows_trusted_aliases(example_global_slr_dataset: xr.Dataset, tmp_path: Path):
+    key = shared_store.publish_dataset(example_global_slr_dataset, store_dir=tmp_path)
+    other_alias_path = shared_store._alias_path(tmp_path, "s3://bucket/slr", uid=os.getuid() + 1)
+    other_alias_path.parent.mkdir(parents=True)
+    other_alias_path.write_text(key)
+    assert shared_store._resolve_key(tmp_path, "s3://bucket/slr") == key
+
+    # The alias was published by another user
+    with patch.object(shared_store, "_is_trusted", side_effect=lambda path: path != other_alias_path):
+        with pytest.raises(KeyError, match="No shared dataset published as s3://bucket/slr"):
+            shared_store._resolve_key(tmp_path, "s3://bucket/slr")
+        # Aliases of the current user are published in a directory of their own
+        shared_store.publish_dataset(example_global_slr_dataset, alias="s3://bucket/slr", store_dir=tmp_path)
+        assert shared_store._resolve_key(tmp_path, "s3://bucket/slr") == key
+
+
+@pytest.mark.skipif(os.getuid() != 0, reason="Files of other users can only be created by root")
+def test_shared_store_ignores_files_of_other_users(example_global_slr_dataset: xr.Dataset, tmp_path: Path):
+    other_uid = 12345
+    key = shared_store.publish_dataset(example_global_slr_dataset, store_dir=tmp_path)
+    # Anyone can leave a marker named after a process they do not run, e.g. init
+    os.chown(tmp_path / key / "refs", other_uid, -1)
+    (tmp_path / key / "refs" / "1").touch()
+    os.chown(tmp_path / key / "refs" / "1", other_uid, -1)
+    assert shared_store.evict_shared_datasets(store_dir=tmp_path) == [key]
+
+    alias_dir = shared_store._alias_path(tmp_path, "s3://bucket/slr").parent
+    alias_dir.mkdir(parents=True)
+    os.chown(alias_dir, other_uid, -1)
+    with pytest.raises(PermissionError, match="was created by another user"):
+        shared_store.publish_dataset(example_global_slr_dataset, alias="s3://bucket/slr", store_dir=tmp_path)
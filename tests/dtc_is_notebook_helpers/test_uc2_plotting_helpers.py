@@ -5,6 +5,7 @@ We expect the plotting functions to run without errors, but we do not validate t
 """
 
 import sys
+from datetime import datetime
 from pathlib import Path
 
 sys.path.append(str(Path(__file__).resolve().parents[3]))
@@ -170,3 +171,85 @@ def test_plot_slr_location_four_panels_invalid_location(example_annual_slr_datas
                 lat0=lat0,
                 lon0=lon0,
             )
+
+
+@pytest.mark.parametrize("cumulative", [False, True])
+def test_annual_slr_frames(example_annual_slr_dataset: xr.Dataset, cumulative: bool):
+    frames = uc2_plotting_helpers._annual_slr_frames(example_annual_slr_dataset, "sdot", cumulative)
+    sdot = example_annual_slr_dataset["sdot"].values
+    assert frames.shape == sdot.shape
+    expected = sdot[:3].sum(axis=0) if cumulative else sdot[2]
+    np.testing.assert_allclose(frames[2], expected)
+
+
+@pytest.mark.parametrize("suffix, writer_name", [(".gif", "PillowWriter"), (".mp4", "FFMpegWriter")])
+def test_animate_annual_slr_map_updates_mesh_per_frame(
+    example_annual_slr_dataset: xr.Dataset, tmp_path: Path, suffix: str, writer_name: str
+):
+    output_path = tmp_path / f"sdot{suffix}"
+    with (
+        patch.object(uc2_plotting_helpers, "FuncAnimation") as mock_animation,
+        patch.object(uc2_plotting_helpers, writer_name) as mock_writer,
+    ):
+        result = uc2_plotting_helpers.animate_annual_slr_map(example_annual_slr_dataset, output_path, fps=2)
+        fig, update_frame = mock_animation.call_args.args
+        assert mock_animation.call_args.kwargs["frames"] == 5
+        mock_animation.return_value.save.assert_called_once_with(output_path, writer=mock_writer.return_value, dpi=100)
+        mock_writer.assert_called_once_with(fps=2)
+
+        mesh, title = update_frame(3)
+        np.testing.assert_allclose(mesh.get_array().reshape(15, 15), example_annual_slr_dataset["sdot"].values[3].T)
+        assert title.get_text() == "Relative sea-level change (1995)"
+    assert result == output_path
+
+
+def test_animate_annual_slr_map_all_nan(example_annual_slr_dataset: xr.Dataset, tmp_path: Path):
+    nan_ds = example_annual_slr_dataset.copy(deep=True)
+    nan_ds["sdot"][:] = np.nan
+    with (
+        patch.object(uc2_plotting_helpers, "FuncAnimation") as mock_animation,
+        patch.object(uc2_plotting_helpers, "PillowWriter"),
+    ):
+        uc2_plotting_helpers.animate_annual_slr_map(nan_ds, tmp_path / "sdot.gif")
+        _, update_frame = mock_animation.call_args.args
+        mesh, _ = update_frame(0)
+        assert mesh.get_clim() == (-1.0, 1.0)
+
+
+def test_animate_annual_slr_map_closes_figure_on_failure(example_annual_slr_dataset: xr.Dataset, tmp_path: Path):
+    open_figures = plt.get_fignums()
+    with (
+        patch.object(uc2_plotting_helpers, "FuncAnimation") as mock_animation,
+        patch.object(uc2_plotting_helpers, "FFMpegWriter"),
+        pytest.raises(FileNotFoundError),
+    ):
+        mock_animation.return_value.save.side_effect = FileNotFoundError("ffmpeg")
+        uc2_plotting_helpers.animate_annual_slr_map(example_annual_slr_dataset, tmp_path / "sdot.mp4")
+    assert plt.get_fignums() == open_figures
+
+
+def test_animate_annual_slr_map_invalid_suffix(example_annual_slr_dataset: xr.Dataset, tmp_path: Path):
+    with pytest.raises(ValueError, match="Animation output must be an .mp4 or .gif file"):
+        uc2_plotting_helpers.animate_annual_slr_map(example_annual_slr_dataset, tmp_path / "sdot.avi")
+
+
+def test_compute_mean_mass_balance_over_time_windows_matches_single_windows(example_mass_balance_dataset: xr.Dataset):
+    ds = example_mass_balance_dataset.load()
+    # Introduce missing values, including a point without any valid value in some windows
+    flux = ds[uc2_plotting_helpers.MASS_BALANCE_COL_NAME].values
+    flux[0, :] = np.nan
+    flux[1, 1:3] = np.nan
+    time_windows = [
+        (datetime(1992, 1, 1), datetime(1996, 12, 31)),
+        (datetime(1993, 1, 1), datetime(1994, 12, 31)),
+        (datetime(1995, 6, 1), datetime(1996, 1, 1)),
+        (datetime(1990, 1, 1), datetime(1991, 12, 31)),
+    ]
+    result = uc2_plotting_helpers.compute_mean_mass_balance_over_time_windows(ds, time_windows)
+    assert result.sizes["window"] == len(time_windows)
+    np.testing.assert_array_equal(result["window_start"].values, np.array([w[0] for w in time_windows], "M8[ns]"))
+
+    for i, (start_time, end_time) in enumerate(time_windows):
+        expected = uc2_plotting_helpers.compute_mean_mass_balance_over_time_window(ds, start_time, end_time)
+        window_ds = result.isel(window=i).drop_vars(["window_start", "window_end"])
+        xr.testing.assert_allclose(window_ds, expected, rtol=1e-5)